@@ -0,0 +1,262 @@
+'''Benchmarks for cleaning edits, making networks, and getting the stats in
+02_wiki_stats.py, on synthetic wikis of a few sizes.
+
+Run from anywhere with:
+    python Tests/benchmark.py --tiers small medium
+
+Each timing is added to benchmark_history.jsonl (one JSON record per line;
+it's local to each checkout, so git ignores it), and compared with the best earlier time for the same tier and benchmark, so
+that regressions stand out. Pass --check to exit with an error when there are
+any.'''
+import os
+import sys
+import time
+import json
+import argparse
+import datetime
+import importlib
+import subprocess
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+# networkTools imports config from the example directory
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO, os.path.join(REPO, 'example')]
+import networkTools as nT
+
+HISTORY_FILE = os.path.join(REPO, 'Tests', 'benchmark_history.jsonl')
+
+# Sizes of the synthetic wikis. Edits per page are heavy-tailed, so the number
+# of edits varies a bit more than the number of pages.
+TIERS = {'tiny': dict(pages=60, editors=40),
+        'small': dict(pages=1000, editors=300),
+        'medium': dict(pages=10000, editors=2000),
+        'large': dict(pages=50000, editors=10000)}
+
+# (edit_limit, editor_limit) pairs to make networks with
+LIMITS = [(None, None), (1, None), (5, None), (None, 5)]
+
+# A benchmark is a regression if it's this much slower than its best time,
+# and slower by at least MIN_REGRESSION seconds (so tiny timings don't count)
+TOLERANCE = 0.25
+MIN_REGRESSION = 0.05
+
+COMMENTS = ['/* Early life */ expand', '/* History */', '/* History */ typo',
+        'New section [12 May 2008]', 'fix', '', 'rv vandalism']
+
+
+def generate_wiki(fn,
+        pages=1000,
+        editors=300,
+        edits_shape=1.2, # Shape of the Pareto distribution of edits per page; lower is more skewed
+        max_edits=5000, # Most edits to a single page
+        anon_ratio=0.1, # Share of edits by anonymous editors
+        bot_ratio=0.03, # Share of edits by bots
+        talk_ratio=0.4, # Share of pages that are talk pages
+        user_talk_ratio=0.5, # Share of talk pages that are user talk pages
+        revert_ratio=0.05, # Share of edits that revert the edit before them
+        seed=0):
+    '''Writes a synthetic wiki to fn, in the tsv format that wikiq creates.
+    Some editors are much more active than others (their activity follows
+    Zipf's law), and each page's edits are spread out over time.
+    Returns the number of edits.'''
+    rng = np.random.default_rng(seed)
+    n_edits = np.minimum(rng.pareto(edits_shape, pages).astype(np.int64) + 1, max_edits)
+    n = n_edits.sum()
+    page = np.repeat(np.arange(pages), n_edits)
+
+    # Pages are main namespace, talk, or user talk pages
+    is_talk = rng.random(pages) < talk_ratio
+    is_user_talk = is_talk & (rng.random(pages) < user_talk_ratio)
+    namespace = np.where(is_user_talk, 3, np.where(is_talk, 1, 0))
+    registered = np.array(['User {}'.format(i) for i in range(editors)], dtype=object)
+    owners = registered[rng.integers(0, editors, pages)]
+    titles = np.array(['Page {}'.format(i) for i in range(pages)], dtype=object)
+    titles = np.where(is_user_talk, 'User talk:' + owners,
+            np.where(is_talk, 'Talk:' + titles, titles))
+
+    # Editors: mostly registered, with a few anons and bots
+    weights = 1 / np.arange(1, editors + 1)
+    editor = registered[rng.choice(editors, size=n, p=weights / weights.sum())]
+    kind = rng.random(n)
+    anons = np.array(['10.0.{}.{}'.format(i // 250, i % 250) for i in range(max(editors // 5, 1))], dtype=object)
+    is_anon_edit = kind < anon_ratio
+    editor[is_anon_edit] = anons[rng.integers(0, len(anons), is_anon_edit.sum())]
+    is_bot_edit = (kind >= anon_ratio) & (kind < anon_ratio + bot_ratio)
+    editor[is_bot_edit] = rng.choice(['HelperBot', 'WikiaBot', 'Wikia'], size=is_bot_edit.sum())
+
+    # Each page starts at a random time, and edits follow every couple of days
+    start = np.datetime64('2004-06-01') + rng.integers(0, 4 * 365, pages).astype('timedelta64[D]')
+    gaps = rng.exponential(2 * 86400, n).astype(np.int64).astype('timedelta64[s]')
+    first = np.r_[0, np.cumsum(n_edits)[:-1]]
+    offsets = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[first], n_edits)
+    date_time = np.minimum(np.repeat(start, n_edits) + offsets, np.datetime64('2010-04-01'))
+
+    # Revision ids go up over time, and reverts point at the edit before them
+    revid = np.empty(n, dtype=np.int64)
+    revid[np.argsort(date_time, kind='stable')] = np.arange(1, n + 1)
+    is_revert = (rng.random(n) < revert_ratio) & (np.arange(n) != first[page])
+    reverteds = np.full(n, '', dtype=object)
+    reverteds[is_revert] = revid[np.flatnonzero(is_revert) - 1].astype(str)
+
+    d = pd.DataFrame({'revid': revid,
+        'date_time': pd.Series(date_time).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'articleid': page,
+        'editor_id': 0,
+        'editor': editor,
+        'title': titles[page],
+        'namespace': namespace[page],
+        'deleted': 'FALSE',
+        'text_chars': rng.integers(100, 20000, n),
+        'revert': np.where(is_revert, 'TRUE', 'FALSE'),
+        'reverteds': reverteds,
+        'sha1': ['{:040x}'.format(x) for x in rng.integers(0, 2**62, n)],
+        'minor': 'FALSE',
+        'anon': np.where(is_anon_edit, 'TRUE', 'FALSE'),
+        'comment': rng.choice(COMMENTS, size=n)})
+    # Dumps aren't in any particular order
+    d.sample(frac=1, random_state=seed).to_csv(fn, sep='\t', index=False)
+    return int(n)
+
+
+def time_benchmark(results, name, func, repeat):
+    '''Adds the fastest of repeat calls to func, in seconds, to results. A
+    benchmark that fails is reported and left out, so the others still run.'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print('  {} failed: {!r}'.format(name, e))
+            return
+        times.append(time.perf_counter() - start)
+    results[name] = min(times)
+
+
+def cleaned_edits(fn):
+    edits = nT.Edits(fn)
+    edits.clean_df()
+    return edits
+
+
+def threshold_edits(edits, threshold):
+    '''Returns an Edits with the same cleaned edits and the given threshold'''
+    copy = nT.Edits(edits.fn, threshold=threshold)
+    copy.df = edits.df
+    return copy
+
+
+def stat_times(fn, repeat):
+    '''Runs 02_wiki_stats.py on a wiki with --profile, and returns the best time
+    of each of its stages'''
+    wiki_stats = importlib.import_module('02_wiki_stats')
+    times = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_dir:
+            args = SimpleNamespace(o=output_dir, t=None, remove_anon=False, d=1,
+                    edgelist=None, cache_dir=None, profile=True, cprofile=False,
+                    metric_workers=1, metric_executor='process', metrics=None)
+            wiki_stats.analyze_wiki(fn, args)
+            with open(wiki_stats.profile_file_name(fn, args)) as f:
+                record = json.load(f)
+        for stage, x in record['stages'].items():
+            times[stage] = min(times.get(stage, float('inf')), x['seconds'])
+    return times
+
+
+def run_tier(tier, data_dir, repeat):
+    '''Generates the wiki for a tier, and returns {benchmark: seconds}'''
+    fn = os.path.join(data_dir, '{}.tsv'.format(tier))
+    n_edits = generate_wiki(fn, **TIERS[tier])
+    print('{}: {} edits'.format(tier, n_edits))
+    results = {}
+    time_benchmark(results, 'clean_df', lambda: cleaned_edits(fn), repeat)
+    edits = cleaned_edits(fn)
+    # Cut off at half of the main namespace edits, like a real threshold would
+    threshold = int((edits.df['namespace'] == 0).sum() // 2)
+    time_benchmark(results, 'threshold_filter', lambda: threshold_edits(edits, threshold).threshold_filter(
+        filter_func = lambda x: (x.namespace == 0) & (x.was_reverted==False)), repeat)
+    for edit_limit, editor_limit in LIMITS:
+        name = 'edit_limit={},editor_limit={}'.format(edit_limit, editor_limit)
+        time_benchmark(results, 'make_network[{}]'.format(name), lambda: nT.make_network(edits,
+            edit_limit=edit_limit, editor_limit=editor_limit), repeat)
+        time_benchmark(results, 'make_network[{},vectorized]'.format(name), lambda: nT.make_network(edits,
+            edit_limit=edit_limit, editor_limit=editor_limit, engine='vectorized'), repeat)
+    time_benchmark(results, 'make_talk_network[edit_limit=5]', lambda: nT.make_talk_network(edits=edits,
+        edit_limit=5), repeat)
+    for stage, seconds in stat_times(fn, repeat).items():
+        results['wiki_stats/' + stage] = seconds
+    return results
+
+
+def load_history(fn):
+    if not os.path.isfile(fn):
+        return []
+    with open(fn) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=REPO, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def find_regressions(records, history):
+    '''Returns the records that are slower than the best earlier time for the
+    same tier and benchmark, with that time added as best_seconds'''
+    best = {}
+    for x in history:
+        key = (x['tier'], x['benchmark'])
+        best[key] = min(best.get(key, float('inf')), x['seconds'])
+    regressions = []
+    for x in records:
+        previous = best.get((x['tier'], x['benchmark']))
+        if (previous is not None and x['seconds'] > previous * (1 + TOLERANCE)
+                and x['seconds'] - previous > MIN_REGRESSION):
+            regressions.append(dict(x, best_seconds=previous))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark networkTools on synthetic wikis')
+    parser.add_argument('--tiers', nargs='+', default=['small', 'medium'], choices=list(TIERS),
+            help='Sizes of wiki to benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='Number of times to run each benchmark; the best time is kept')
+    parser.add_argument('--history', default=HISTORY_FILE,
+            help='File of earlier results, which new results are added to')
+    parser.add_argument('--check', action='store_true',
+            help='Exit with an error if any benchmark is slower than its best earlier time')
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    run = {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': sys.version.split()[0]}
+    records = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for tier in args.tiers:
+            for benchmark, seconds in run_tier(tier, data_dir, args.repeat).items():
+                records.append(dict(run, tier=tier, benchmark=benchmark, seconds=seconds))
+                print('  {:<60} {:8.3f}s'.format(benchmark, seconds))
+    regressions = find_regressions(records, history)
+    for x in regressions:
+        print('Regression in {} {}: {:.3f}s, best was {:.3f}s'.format(
+            x['tier'], x['benchmark'], x['seconds'], x['best_seconds']))
+    with open(args.history, 'a') as f:
+        for x in records:
+            f.write(json.dumps(x) + '\n')
+    if args.check and regressions:
+        sys.exit(1)
+    return records
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark
+from benchmark import nT
+
+
+def test_generated_wiki_can_be_cleaned(tmp_path):
+    fn = str(tmp_path / 'wiki.tsv')
+    n_edits = benchmark.generate_wiki(fn, pages=200, editors=50, bot_ratio=0.1)
+    assert len(pd.read_csv(fn, sep='\t')) == n_edits
+    edits = nT.Edits(fn)
+    edits.clean_df()
+    assert 0 < edits.bot_edit_count < n_edits * 0.2
+    assert edits.df['anon'].any()
+    assert edits.df['was_reverted'].any()
+    assert set(edits.df['namespace']) == {0, 1, 3}
+
+
+def test_benchmark_history_finds_regressions(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, 'TIERS', {'tiny': dict(pages=20, editors=10)})
+    history = str(tmp_path / 'history.jsonl')
+    records = benchmark.main(['--tiers', 'tiny', '--repeat', '1', '--history', history])
+    assert 'clean_df' in {x['benchmark'] for x in records}
+    assert len(benchmark.load_history(history)) == len(records)
+    slower = [dict(x, seconds=x['seconds'] * 2 + 1) for x in records]
+    assert len(benchmark.find_regressions(slower, records)) == len(records)
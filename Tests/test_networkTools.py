@@ -0,0 +1,473 @@
+import os
+import sys
+import random
+import datetime
+import json
+import functools
+import pickle
+import gc
+import warnings
+import multiprocessing
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# networkTools imports config from the example directory
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO, os.path.join(REPO, 'example')]
+import networkTools as nT
+
+
+def make_edits(n_pages=40, seed=0):
+    '''Creates an Edits object with a small, random set of cleaned edits'''
+    r = random.Random(seed)
+    editors = ['A', 'B', 'C', 'D', 'E', 'F', '10.0.0.1']
+    comments = ['/* Intro */ fix', '/* History */', 'New thing [12 May 2008]', None]
+    rows = []
+    for page in range(n_pages):
+        namespace = r.choice([0, 1, 3])
+        title = 'User talk:B' if namespace == 3 else 'Page {}'.format(page)
+        t = datetime.datetime(2006, 1, 1) + datetime.timedelta(days=page)
+        for _ in range(r.randint(1, 25)):
+            t += datetime.timedelta(hours=r.randint(1, 100))
+            editor = r.choice(editors)
+            rows.append({'articleid': page, 'title': title, 'namespace': namespace,
+                'editor': editor, 'anon': nT.is_anon(editor), 'date_time': t,
+                'comment': r.choice(comments)})
+    edits = nT.Edits(fn=None)
+    edits.df = pd.DataFrame(rows).sort_values('date_time')
+    return edits
+
+
+def capture_edges(monkeypatch, **kwargs):
+    '''Runs make_network and returns the edges passed to EditNetwork.make_network'''
+    captured = []
+    make = nT.EditNetwork.make_network
+    def record(self, edges):
+        captured.append(list(edges))
+        return make(self, edges)
+    monkeypatch.setattr(nT.EditNetwork, 'make_network', record)
+    nT.make_network(**kwargs)
+    return captured[0]
+
+
+@pytest.mark.parametrize('edit_limit', [None, 1, 3])
+@pytest.mark.parametrize('editor_limit', [None, 2])
+@pytest.mark.parametrize('section_filter', [False, True])
+@pytest.mark.parametrize('time_limit', [None, 2])
+def test_vectorized_engine_matches_python(monkeypatch, edit_limit, editor_limit, section_filter, time_limit):
+    edits = make_edits()
+    params = dict(edits=edits, edit_limit=edit_limit, editor_limit=editor_limit,
+            section_filter=section_filter, time_limit=time_limit)
+    python_edges = capture_edges(monkeypatch, engine='python', **params)
+    vectorized_edges = capture_edges(monkeypatch, engine='vectorized', **params)
+    assert len(python_edges) > 0
+    assert Counter(python_edges) == Counter(vectorized_edges)
+
+
+def write_tsv(edits, fn):
+    '''Writes edits out in the wikiq format that Edits reads'''
+    d = edits.df.sample(frac=1, random_state=0).copy()
+    d['revid'] = range(1, len(d) + 1)
+    d['reverteds'] = [str(x - 1) if x % 10 == 0 else None for x in d['revid']]
+    d['sha1'] = 'abc'
+    d['date_time'] = d['date_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    d.to_csv(fn, sep='\t', index=False)
+
+
+def test_chunked_edits_match_full_read(tmp_path):
+    fn = str(tmp_path / 'wiki.tsv')
+    write_tsv(make_edits(), fn)
+    full = nT.Edits(fn)
+    full.clean_df()
+    chunked = nT.Edits(fn, chunksize=30)
+    chunked.clean_df()
+    assert len(chunked.runs) > 1
+    merged = pd.concat(list(chunked.page_frames()))
+    expected = next(full.page_frames())
+    assert merged.reset_index(drop=True).equals(expected.reset_index(drop=True))
+    assert chunked.num_talk_edits() == full.num_talk_edits()
+
+
+@pytest.mark.parametrize('bad_row', [0, -1])
+@pytest.mark.filterwarnings('ignore:Could not infer format')
+def test_chunked_edits_raise_cleaning_errors(tmp_path, bad_row):
+    fn = str(tmp_path / 'wiki.tsv')
+    write_tsv(make_edits(), fn)
+    d = pd.read_csv(fn, sep='\t', dtype={'reverteds': object})
+    d.loc[d.index[bad_row], 'date_time'] = '2008-13-45 00:00:00'
+    d.to_csv(fn, sep='\t', index=False)
+    with pytest.raises(ValueError):
+        nT.Edits(fn).clean_df()
+    with warnings.catch_warnings(record=True) as caught:
+        # The file should be closed, even though cleaning fails
+        warnings.simplefilter('always', ResourceWarning)
+        with pytest.raises(ValueError):
+            nT.Edits(fn, chunksize=30).clean_df()
+        gc.collect()
+    assert not [x for x in caught if 'unclosed file' in str(x.message)]
+    with pytest.raises(ValueError):
+        nT.Edits(fn, chunksize=30, cache_dir=str(tmp_path / 'cache'))
+    # Empty files are still skipped
+    open(fn, 'w').close()
+    edits = nT.Edits(fn, chunksize=30)
+    edits.clean_df()
+    assert edits.runs == []
+    edits = nT.Edits(fn, threshold=10)
+    edits.clean_df()
+    edits.threshold_filter('namespace == 0')
+    assert edits.df is None
+
+
+def test_clean_df_removes_bots_and_duplicate_edits(tmp_path):
+    fn = str(tmp_path / 'wiki.tsv')
+    write_tsv(make_edits(n_pages=5), fn)
+    d = pd.read_csv(fn, sep='\t', dtype={'reverteds': object})
+    bad_editor, bad_sha = sorted(nT.config.bad_sha_list)[0]
+    extra = d.iloc[:4].copy()
+    extra['editor'] = ['HelperBot', 'WikiaBot', bad_editor, '2001:DB8:0:0:0:0:0:1']
+    extra['sha1'] = ['abc', 'abc', bad_sha, 'abc']
+    pd.concat([d, extra]).to_csv(fn, sep='\t', index=False)
+    edits = nT.Edits(fn)
+    edits.clean_df()
+    assert edits.bot_edit_count == 2
+    assert edits.dup_edit_count == 1
+    assert len(edits.df) == len(d) + 1
+    assert edits.df.loc[edits.df['editor'].str.contains(':'), 'anon'].all()
+
+
+def test_cleaned_edits_cache(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    fn = str(tmp_path / 'wiki.tsv')
+    write_tsv(make_edits(), fn)
+    cold = nT.Edits(fn, cache_dir=str(tmp_path / 'cache'))
+    cold.clean_df()
+    # The second time, the file shouldn't be read at all
+    monkeypatch.setattr(nT.Edits, 'read_edits', None)
+    warm = nT.Edits(fn, cache_dir=str(tmp_path / 'cache'))
+    warm.clean_df()
+    assert warm.df.equals(cold.df.reset_index(drop=True))
+    assert warm.bot_edit_count == cold.bot_edit_count
+
+
+def edge_weights(network):
+    return sorted((network.vs[e.source]['name'], network.vs[e.target]['name'], e['weight'])
+            for e in network.es)
+
+
+@pytest.mark.parametrize('edit_limit', [None, 3])
+@pytest.mark.parametrize('time_limit', [None, 2])
+def test_incremental_network_matches_full_build(tmp_path, edit_limit, time_limit):
+    edits = make_edits()
+    full = nT.make_network(edits, edit_limit=edit_limit, time_limit=time_limit, section_filter=True)
+    incremental = nT.IncrementalNetwork(edit_limit=edit_limit, time_limit=time_limit, section_filter=True)
+    for cutoff in ['2006-01-20', '2006-02-10', None]:
+        new_edits = nT.Edits(fn=None)
+        new_edits.df = edits.df if cutoff is None else edits.df[edits.df['date_time'] < cutoff]
+        incremental.update(new_edits)
+        # Make sure the state survives being saved between updates
+        incremental.save(str(tmp_path / 'state.pkl'))
+        incremental = nT.IncrementalNetwork.load(str(tmp_path / 'state.pkl'))
+    assert edge_weights(incremental.get_network()) == edge_weights(full)
+
+
+@pytest.mark.parametrize('edit_limit', [None, 3])
+@pytest.mark.parametrize('section_filter', [False, True])
+def test_incremental_edges_match_make_edges(edit_limit, section_filter):
+    edits = make_edits()
+    incremental = nT.IncrementalNetwork(edit_limit=edit_limit, section_filter=section_filter)
+    edges = incremental.update(edits)
+    expected = nT.make_edges(edits, edit_limit=edit_limit, section_filter=section_filter)
+    assert (edges['edit_type'] == nT.COLLABORATIVE).any()
+    assert Counter(edges.edges()) == Counter(expected.edges())
+    # Edges in a later update are only collaborative if the editor came back in it
+    split = nT.IncrementalNetwork(edit_limit=edit_limit, section_filter=section_filter)
+    earlier = nT.Edits(fn=None)
+    earlier.df = edits.df[edits.df['date_time'] < '2006-02-01']
+    first = split.update(earlier)
+    second = split.update(edits)
+    assert Counter(first.edges()) == Counter(nT.make_edges(earlier, edit_limit=edit_limit,
+        section_filter=section_filter).edges())
+    collaborative = Counter(e for e in edges if e.edit_type == 'collaborative')
+    assert Counter(e for e in second if e.edit_type == 'collaborative') <= collaborative
+
+
+def test_time_limit_removes_later_edges():
+    edits = make_edits()
+    unlimited = edge_weights(nT.make_network(edits))
+    limited = edge_weights(nT.make_network(edits, time_limit=2))
+    assert sum(x[2] for x in limited) < sum(x[2] for x in unlimited)
+
+
+def test_snapshots_match_networks_from_earlier_edits():
+    edits = make_edits()
+    cutoffs = pd.to_datetime(['2006-01-15', '2006-02-01', '2006-02-20'])
+    snapshots = list(nT.make_network_snapshots(edits, cutoffs, edit_limit=3))
+    assert [x[0] for x in snapshots] == list(cutoffs)
+    for cutoff, snapshot in snapshots:
+        earlier = nT.Edits(fn=None)
+        earlier.df = edits.df[edits.df['date_time'] < cutoff]
+        assert edge_weights(snapshot) == edge_weights(nT.make_network(earlier, edit_limit=3))
+
+
+def edge_attributes(network):
+    return sorted((network.vs[e.source]['name'], network.vs[e.target]['name'],
+        sorted((k, str(v)) for k, v in e.attributes().items())) for e in network.es)
+
+
+@pytest.mark.parametrize('edit_limit', [None, 3])
+def test_array_backend_matches_igraph(edit_limit):
+    edits = make_edits()
+    igraph_network = nT.make_network(edits, edit_limit=edit_limit, backend='igraph')
+    array_network = nT.make_network(edits, edit_limit=edit_limit, backend='arrays')
+    assert edge_attributes(array_network) == edge_attributes(igraph_network)
+
+
+def test_edge_buffer_round_trip(monkeypatch):
+    monkeypatch.setattr(nT.EdgeBuffer, 'CHUNK_SIZE', 16)
+    edges = list(nT.make_edges(make_edits(), edit_limit=3))
+    assert len(edges) > 16
+    buffer = nT.EdgeBuffer.from_edges(edges)
+    assert buffer.edges() == edges
+    assert {e.edit_type for e in buffer} == set(nT.EDIT_TYPES)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_hierarchy_matches_shortest_paths(seed):
+    r = random.Random(seed)
+    network = nT.EditNetwork()
+    network.add_vertices([str(i) for i in range(30)])
+    network.add_edges([(r.randrange(30), r.randrange(30)) for _ in range(40)])
+    # Count the paths the slow way, from all of the shortest paths
+    p = network.distances()
+    paths = [(i, j) for i in range(30) for j in range(30) if i != j and p[i][j] != float('inf')]
+    h_paths = sum(p[j][i] == float('inf') for i, j in paths)
+    assert network.hierarchy() == h_paths / len(paths)
+
+
+def test_sampled_betweenness_estimates_exact():
+    ba = nT.igraph.Graph.Barabasi(300, 2, directed=True)
+    network = nT.EditNetwork()
+    network.add_vertices([str(i) for i in range(300)])
+    network.add_edges(ba.get_edgelist() + [(b, a) for a, b in ba.get_edgelist()[::3]])
+    exact = network.betweenness()
+    assert network.betweenness(samples=300) == exact
+    estimate, error = network.betweenness(samples=150, seed=0, return_error=True)
+    assert estimate == network.betweenness(samples=150, seed=0)
+    assert sum(estimate) == pytest.approx(sum(exact), rel=0.2)
+    assert 0 < sum(error) < sum(exact)
+    # Same shapes as the exact betweenness, for one vertex or many
+    for vertices in [np.array([1, 2, 3]), [1, 2, 3], range(1, 4), 2, '2']:
+        exact = network.betweenness(vertices=vertices)
+        estimate = network.betweenness(vertices=vertices, samples=50, seed=0)
+        assert type(estimate) == type(exact)
+        if isinstance(exact, list):
+            assert len(estimate) == len(exact)
+
+
+def test_profiler_records_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(nT, 'PROFILER', nT.Profiler(cprofile=True))
+    network = nT.make_network(make_edits(), edit_limit=3)
+    nT.PROFILER.write(str(tmp_path / 'profile.json'))
+    with open(str(tmp_path / 'profile.json')) as f:
+        record = json.load(f)
+    assert {'make_network', 'make_network/make_edges', 'make_network/dichotomize'} <= set(record['stages'])
+    assert record['stages']['make_network']['profile']
+    assert record['counters']['network_nodes'] == network.vcount()
+
+
+@pytest.mark.parametrize('filter_func', [
+    lambda x: x.namespace == 0,
+    'namespace == 0',
+    # Only works on single edits, so it's applied row by row
+    lambda x: x['namespace'] == 0 and x['editor'] != '',
+    ])
+def test_threshold_filter_keeps_edits_before_threshold(filter_func):
+    edits = make_edits()
+    edits.df['was_reverted'] = False
+    edits.threshold = 20
+    full = edits.df
+    edits.threshold_filter(filter_func)
+    counted = (edits.df['namespace'] == 0).cumsum()
+    assert counted.iloc[-1] == 20
+    # Everything up to the next edit that counts is kept
+    assert len(edits.df) == (full['namespace'] == 0).cumsum().le(20).sum()
+    assert (edits.df['quality'] == 1).all()
+    edits = make_edits()
+    edits.threshold = 10**6
+    edits.threshold_filter(filter_func)
+    assert edits.df is None
+
+
+def test_get_last_active_finds_last_multi_editor_period():
+    edits = nT.Edits(fn=None)
+    edits.df = pd.DataFrame({'editor': ['A', 'B', 'A', 'A', 'C', 'B', 'B'],
+        'date_time': pd.to_datetime(['2006-01-01', '2006-01-05', '2006-03-01', '2006-03-10',
+            '2006-05-01', '2006-06-15', '2006-06-20'])})
+    assert edits.get_last_active(n_days=50, n_editors=2) == pd.Timestamp('2006-06-20')
+    assert edits.get_last_active(n_days=30, n_editors=2) == pd.Timestamp('2006-01-05')
+    assert edits.get_last_active(n_days=30, n_editors=2, min_date='2006-02-01') is None
+    assert edits.get_last_active(n_days=100, n_editors=3) == pd.Timestamp('2006-06-15')
+
+
+def test_section_ids_match_get_section_from_comment():
+    comments = ['/* Intro */ fix', '/* History */', 'New thing [12 May 2008]', None, '',
+            'plain', '/* a */ b /* c */ d', ' /* not a section */', 'x [y] z [w]', '/* Intro */']
+    ids, names = nT.section_ids(comments)
+    assert [names[i] if i >= 0 else None for i in ids] == \
+        [nT.get_section_from_comment({'comment': x}) for x in comments]
+    assert ids[0] == ids[-1]
+
+
+@pytest.mark.parametrize('dichotomize_level', [1, 2])
+def test_remove_user_talk_matches_network_without_owner_edges(dichotomize_level):
+    edits = make_edits()
+    network = nT.make_talk_network(edits=edits, include_user_talk=False, dichotomize_level=dichotomize_level)
+    edges = nT.make_edges(edits, namespace_filter=lambda x: x % 2 == 1)
+    assert (edges['edit_type'] == nT.USER_TALK_OWNER).any()
+    expected = nT.EditNetwork()
+    expected.merge_edges(edges.take(edges['edit_type'] != nT.USER_TALK_OWNER))
+    expected = expected.dichotomize(dichotomize_level)
+    assert edge_attributes(network) == edge_attributes(expected)
+    assert sorted(network.vs['name']) == sorted(expected.vs['name'])
+
+
+@pytest.mark.parametrize('engine', ['python', 'vectorized'])
+def test_make_networks_matches_separate_networks(engine):
+    edits = make_edits()
+    networks = nT.make_networks(edits, edit_limit=3, engine=engine)
+    assert edge_weights(networks['coedit']) == edge_weights(nT.make_coedit_network(edits=edits, edit_limit=3))
+    assert edge_weights(networks['talk']) == edge_weights(nT.make_talk_network(edits=edits, edit_limit=3))
+    collaboration = nT.make_collaboration_network(edits=edits, edit_limit=3, engine=engine)
+    assert edge_weights(networks['collaboration']) == edge_weights(collaboration)
+    # Same as keeping just the collaborative edges from all of them
+    edges = nT.make_edges(edits, edit_limit=3, namespace_filter=lambda x: x % 2 == 0)
+    expected = nT.network_from_edges(edges.take(edges['edit_type'] == nT.COLLABORATIVE))
+    assert edge_weights(collaboration) == edge_weights(expected)
+    assert collaboration.ecount() < networks['coedit'].ecount()
+
+
+def test_dichotomize_many_and_subgraph():
+    network = nT.make_network(make_edits())
+    thresholds = [1, 2, 3, 100]
+    networks = network.dichotomize_many(thresholds)
+    for threshold in thresholds:
+        expected = network.dichotomize(threshold)
+        assert edge_weights(networks[threshold]) == edge_weights(expected)
+        assert networks[threshold].vcount() == expected.vcount()
+        assert all(w >= threshold for w in networks[threshold].es['weight'])
+    assert networks[100].vcount() == 0
+    sub = network.subgraph(['A', 'B', 'nobody'])
+    assert sorted(sub.vs['name']) == ['A', 'B']
+
+
+@pytest.mark.parametrize('ext', ['tsv', 'tsv.gz', 'parquet', 'npz'])
+def test_write_edges_round_trip(tmp_path, ext):
+    if ext == 'parquet':
+        pytest.importorskip('pyarrow')
+    network = nT.make_network(make_edits(), edit_limit=3)
+    # Missing values should survive too
+    network.es[0].update_attributes(timediff=None, intermediate_edits=None)
+    fn = str(tmp_path / 'edges.{}'.format(ext))
+    network.write_edges(fn, block_size=7)
+    loaded = nT.EditNetwork.read_edges(fn)
+    assert edge_attributes(loaded) == edge_attributes(network)
+    assert network.get_edgelist_with_atts()['header'] == ['from_node', 'to_node'] + sorted(network.es.attribute_names())
+
+
+def test_cached_network_is_reused(tmp_path):
+    edits = make_edits()
+    calls = []
+    def make(edits, namespace_filter=lambda x: x % 2 == 1, **kwargs):
+        calls.append(kwargs)
+        return nT.make_talk_network(edits=edits, namespace_filter=namespace_filter, **kwargs)
+    cache_dir = str(tmp_path / 'cache')
+    network = nT.cached_network(edits, cache_dir, make, edit_limit=3)
+    cached = nT.cached_network(edits, cache_dir, make, edit_limit=3, engine='vectorized')
+    assert len(calls) == 1
+    assert edge_attributes(cached) == edge_attributes(network)
+    # Different parameters or edits make a new network
+    nT.cached_network(edits, cache_dir, make, edit_limit=2)
+    nT.cached_network(edits, cache_dir, make, edit_limit=3, namespace_filter=lambda x: x == 1)
+    edits.df = edits.df.iloc[1:]
+    nT.cached_network(edits, cache_dir, make, edit_limit=3)
+    assert len(calls) == 4
+    assert nT.cached_network(edits, cache_dir, make, edit_limit=3, namespace_filter=lambda x: x == 99) is None
+    assert nT.cached_network(edits, cache_dir, make, edit_limit=3, namespace_filter=lambda x: x == 98) is None
+    assert len(calls) == 5
+
+
+def kcore_count(network, k, coreness):
+    return sum(x > k for x in coreness)
+
+
+def coreness_calls(network):
+    coreness_calls.n += 1
+    return network.coreness()
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_compute_metrics_matches_direct_calls(monkeypatch, executor, max_workers):
+    monkeypatch.setattr(nT, 'PROFILER', nT.Profiler())
+    coreness_calls.n = 0
+    network = nT.make_network(make_edits())
+    metrics = {'density': (nT.EditNetwork.density, ()),
+            'kcore.gt.1': (functools.partial(kcore_count, k=1), ('coreness',)),
+            'hierarchy': (nT.EditNetwork.hierarchy, ()),
+            'kcore.gt.2': (functools.partial(kcore_count, k=2), ('coreness',))}
+    stats = nT.compute_metrics(network, metrics, {'coreness': coreness_calls},
+            max_workers=max_workers, executor=executor)
+    assert list(stats) == list(metrics)
+    assert stats['density'] == network.density()
+    assert stats['hierarchy'] == network.hierarchy()
+    assert stats['kcore.gt.2'] == sum(x > 2 for x in network.coreness())
+    assert stats['kcore.gt.1'] == sum(x > 1 for x in network.coreness())
+    if executor == 'thread' or max_workers == 1:
+        assert coreness_calls.n == 1
+    stages = nT.PROFILER.to_dict()['stages']
+    assert stages['compute_metrics/coreness']['calls'] == 1
+    assert {'compute_metrics/' + x for x in metrics} <= set(stages)
+
+
+def test_edit_network_keeps_directedness():
+    assert nT.EditNetwork().is_directed()
+    assert not nT.EditNetwork(3, [(0, 1)], False).is_directed()
+    network = nT.make_network(make_edits())
+    network.make_undirected()
+    assert not network.is_directed()
+    copy = pickle.loads(pickle.dumps(network))
+    assert isinstance(copy, nT.EditNetwork)
+    assert not copy.is_directed()
+    assert edge_attributes(copy) == edge_attributes(network)
+    assert pickle.loads(pickle.dumps(nT.make_network(make_edits()))).is_directed()
+
+
+def test_compute_metrics_in_spawned_processes():
+    # Spawned workers get the network by pickling, unlike forked ones
+    network = nT.make_network(make_edits())
+    network.make_undirected()
+    metrics = {'density': (nT.EditNetwork.density, ()),
+            'directed': (nT.EditNetwork.is_directed, ()),
+            'mean.weight': (nT.EditNetwork.mean_weight, ())}
+    serial = nT.compute_metrics(network, metrics, max_workers=1)
+    spawned = nT.compute_metrics(network, metrics, max_workers=2,
+            mp_context=multiprocessing.get_context('spawn'))
+    assert spawned == serial
+    assert serial['directed'] is False
+
+
+@pytest.mark.parametrize('ext', ['tsv', 'tsv.gz', 'parquet', 'npz'])
+def test_read_edges_keeps_numeric_names(tmp_path, ext):
+    if ext == 'parquet':
+        pytest.importorskip('pyarrow')
+    network = nT.EditNetwork()
+    network.add_vertices(['007', '42'])
+    network.add_edges([(0, 1)], attributes={'weight': [2.0]})
+    fn = str(tmp_path / 'edges.{}'.format(ext))
+    network.write_edges(fn)
+    loaded = nT.EditNetwork.read_edges(fn)
+    assert loaded.vs['name'] == ['007', '42']
+    assert edge_weights(loaded) == edge_weights(network)
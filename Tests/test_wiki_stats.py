@@ -0,0 +1,77 @@
+import os
+import sys
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark
+
+wiki_stats = importlib.import_module('02_wiki_stats')
+
+
+def make_args(output_dir, metrics=None, d=1):
+    return SimpleNamespace(o=output_dir, t=None, remove_anon=False, d=d, edgelist=None,
+            cache_dir=None, profile=False, cprofile=False, metric_workers=1,
+            metric_executor='process', metrics=metrics)
+
+
+def fail(*args, **kwargs):
+    raise AssertionError('This stat was already computed')
+
+
+def test_only_missing_stats_are_computed(tmp_path, monkeypatch):
+    fn = str(tmp_path / 'wiki.tsv')
+    benchmark.generate_wiki(fn, pages=200, editors=50)
+    os.makedirs(str(tmp_path / 'full'))
+    full = wiki_stats.analyze_wiki(fn, make_args(str(tmp_path / 'full')))
+    assert list(full) == ['wiki.name'] + [x for x, m in wiki_stats.METRICS.items() if m.enabled]
+
+    partial_dir = str(tmp_path / 'partial')
+    os.makedirs(partial_dir)
+    row = wiki_stats.analyze_wiki(fn, make_args(partial_dir, ['density', 'main.ns.edits']))
+    assert set(row) == {'wiki.name', 'density', 'main.ns.edits'}
+    # The stats that are already there aren't computed again
+    for name in ['density', 'main.ns.edits']:
+        monkeypatch.setitem(wiki_stats.METRICS, name, wiki_stats.METRICS[name]._replace(func=fail))
+    row = wiki_stats.analyze_wiki(fn, make_args(partial_dir))
+    assert list(row) == list(full)
+    assert wiki_stats.read_stats(wiki_stats.output_file_name(fn, make_args(partial_dir))) == \
+            wiki_stats.read_stats(wiki_stats.output_file_name(fn, make_args(str(tmp_path / 'full'))))
+    assert wiki_stats.analyze_wiki(fn, make_args(partial_dir)) is None
+
+
+def test_stats_with_different_parameters_are_recomputed(tmp_path):
+    fn = str(tmp_path / 'wiki.tsv')
+    benchmark.generate_wiki(fn, pages=200, editors=50)
+    output_dir = str(tmp_path / 'output')
+    os.makedirs(output_dir)
+    wiki_stats.analyze_wiki(fn, make_args(output_dir, ['network.nodes']))
+    # Adding a stat with another dichotomize level recomputes the whole row
+    row = wiki_stats.analyze_wiki(fn, make_args(output_dir, ['network.nodes', 'density'], d=2))
+    assert set(row) == {'wiki.name', 'network.nodes', 'density'}
+    expected_dir = str(tmp_path / 'expected')
+    os.makedirs(expected_dir)
+    expected = wiki_stats.analyze_wiki(fn, make_args(expected_dir, ['network.nodes', 'density'], d=2))
+    assert row == expected
+    assert wiki_stats.analyze_wiki(fn, make_args(output_dir, ['network.nodes', 'density'], d=2)) is None
+
+
+def test_output_directory_is_created(tmp_path):
+    fn = str(tmp_path / 'wiki.tsv')
+    benchmark.generate_wiki(fn, pages=50, editors=20)
+    args = make_args(str(tmp_path / 'new' / 'output'), ['main.ns.edits'])
+    args.profile = True
+    assert wiki_stats.analyze_wiki(fn, args)
+    assert os.path.isfile(wiki_stats.output_file_name(fn, args))
+    assert os.path.isfile(wiki_stats.profile_file_name(fn, args))
+
+
+@pytest.mark.parametrize('argv', [[], ['-i', 'no/such/wiki.tsv'], ['-i', 'no/such/dir/*.tsv']])
+def test_missing_input_is_an_error(tmp_path, monkeypatch, capsys, argv):
+    monkeypatch.setattr(sys, 'argv', ['02_wiki_stats.py', '-o', str(tmp_path)] + argv)
+    with pytest.raises(SystemExit) as e:
+        wiki_stats.main()
+    assert e.value.code == 2
+    assert not os.path.exists(str(tmp_path / 'all_stats.csv'))
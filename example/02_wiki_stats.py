@@ -3,7 +3,13 @@ import pandas as pd
 import sys
 import csv
 import argparse
+import glob
+import os
+import time
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from os import path
+from collections import namedtuple
 import networkTools as nT
 from statistics import median, mean
 import config
@@ -14,34 +20,244 @@ TIME_LIMIT = None # None means there is no limit
 # Edits must be within this many edits of each other
 EDIT_LIMIT = 5
 
+##### Parameters for the stats #####
+# Exact betweenness takes O(nm) time, so for networks with more nodes than this
+# it's estimated from the shortest paths from BETWEENNESS_SAMPLES random nodes
+EXACT_BETWEENNESS_LIMIT = 5000
+BETWEENNESS_SAMPLES = 2000
+# The network stats are computed at once, in a pool of workers (see
+# nT.compute_metrics). For networks with fewer nodes than this, starting the
+# workers takes longer than the stats, so they're computed one after another.
+PARALLEL_METRICS_MIN_NODES = 1000
+
+# The first column of the stats files, which says which wiki the stats are for.
+# The other columns are the stats in METRICS (at the end of this file).
+KEY_COLUMN = 'wiki.name'
+
 def main():
 
     parser = argparse.ArgumentParser(description='Create temporal measures from wiki')
-    parser.add_argument('-i', help='Location of the tsv file of wiki edits')
+    parser.add_argument('-i', required=True, help='Location of the tsv file of wiki edits. To analyze many wikis, '
+            'pass a directory of tsv files or a glob pattern (in quotes)')
     parser.add_argument('-t', type=int, help='Threshold number of edits')
     parser.add_argument('-o', type=str, help='Output file directory. Defaults to ./output',
             default='./output', nargs='?')
     parser.add_argument('--remove_anon', help='Pass this flag to remove anonymous contributors', action='store_true')
     parser.add_argument('-d', type=int, default=1,
             help='Value at which to dichotimize graph')
-    parser.add_argument('--edgelist', help = 'If a file location is passed in, saves the edgelist to that location and quits.',
+    parser.add_argument('--edgelist', help = 'If a file location is passed in, saves the edgelist (with edge attributes) to that location and quits. '
+            'The extension picks the format: .tsv, .tsv.gz, .parquet or .npz',
             default = None)
+    parser.add_argument('--cache_dir', help = 'Directory for caching the cleaned edits and the network, so later runs on the same file are faster',
+            default = None)
+    parser.add_argument('-j', type=int, default=None,
+            help='Number of wikis to analyze at once. Defaults to the number of cores')
+    parser.add_argument('--combined', default=None,
+            help='When analyzing many wikis, also writes all of the stats to this file. '
+            'Defaults to all_stats.csv in the output directory')
+    parser.add_argument('--profile', action='store_true',
+            help='Record how long each stage takes (along with peak memory and edit/edge counts), '
+            'and write it to a JSON file next to each wiki\'s stats file')
+    parser.add_argument('--cprofile', action='store_true',
+            help='Like --profile, but also include the slowest functions in each stage, from cProfile')
+    parser.add_argument('--metric_workers', type=int, default=None,
+            help='Number of network stats to compute at once. Defaults to the number of cores '
+            'for a single wiki, and 1 when analyzing many wikis (since the wikis are analyzed at once)')
+    parser.add_argument('--metric_executor', choices=['process', 'thread'], default='process',
+            help='Whether to compute the network stats in processes or threads')
+    parser.add_argument('--metrics', nargs='+', choices=list(METRICS), default=None, metavar='METRIC',
+            help='Stats to compute, out of: {}. Defaults to all of them except {}. For wikis with a stats '
+            'file, only the stats that are not in it yet are computed, and added to it'.format(
+                ', '.join(METRICS), ', '.join(x for x in METRICS if not METRICS[x].enabled)))
 
     args = parser.parse_args()
 
+    files = wiki_files(args.i)
+    if not files:
+        parser.error('No tsv files found at {}'.format(args.i))
+    if args.metric_workers is None:
+        args.metric_workers = os.cpu_count() if len(files) == 1 else 1
+    if len(files) == 1:
+        analyze_wiki(files[0], args)
+    elif args.edgelist:
+        parser.error('--edgelist can only be used with a single wiki')
+    else:
+        analyze_wikis(files, args)
+
+
+def wiki_files(location):
+    '''Returns the tsv files at location (a file, directory, or glob pattern),
+    largest first so that the slowest wikis start first'''
+    if path.isdir(location):
+        files = glob.glob(path.join(location, '*.tsv'))
+    else:
+        files = glob.glob(location)
+    return sorted(files, key=path.getsize, reverse=True)
+
+
+def get_wiki_name(fn):
+    return re.match(r'(.*)\.tsv', path.split(fn)[1]).group(1)
+
+
+def output_file_name(fn, args):
+    return '{}/{}_stats.csv'.format(args.o, get_wiki_name(fn))
+
+
+def profile_file_name(fn, args):
+    return '{}/{}_profile.json'.format(args.o, get_wiki_name(fn))
+
+
+def params_file_name(fn, args):
+    return '{}/{}_params.json'.format(args.o, get_wiki_name(fn))
+
+
+def stats_params(args):
+    '''Returns the parameters that the stats depend on, which are saved next to
+    each stats file, so that stats made with different ones aren't mixed'''
+    return {'t': args.t,
+            'd': args.d,
+            'remove_anon': args.remove_anon,
+            'edit_limit': EDIT_LIMIT,
+            'time_limit': TIME_LIMIT}
+
+
+def selected_metrics(args):
+    '''Returns the names of the stats to compute: the ones passed with
+    --metrics, or else all of the enabled ones'''
+    return args.metrics or [name for name, x in METRICS.items() if x.enabled]
+
+
+def read_stats(fn):
+    '''Returns the row of an existing stats file as {column: value}, or {} if
+    there isn't one'''
+    if not path.isfile(fn):
+        return {}
+    with open(fn) as f:
+        rows = list(csv.DictReader(f))
+    return rows[0] if rows else {}
+
+
+def order_stats(row):
+    '''Returns a row of stats ({column: value}) with its columns in the order of
+    METRICS, followed by any that aren't in METRICS (e.g., stats that have since
+    been taken out)'''
+    columns = [KEY_COLUMN] + [x for x in METRICS if x in row] + [
+            x for x in row if x != KEY_COLUMN and x not in METRICS]
+    return {x: row[x] for x in columns}
+
+
+def existing_stats(fn, args):
+    '''Returns the stats in a wiki's stats file as {column: value}, or {} if
+    there aren't any, or if they were made with different parameters (or with
+    no record of them), in which case they're all computed again'''
+    row = read_stats(output_file_name(fn, args))
+    if not row:
+        return row
+    try:
+        with open(params_file_name(fn, args)) as f:
+            params = json.load(f)
+    except FileNotFoundError:
+        params = None
+    if params != stats_params(args):
+        print('{} stats were made with different parameters, so they will all be computed again'.format(
+            get_wiki_name(fn)))
+        return {}
+    return row
+
 
-    wiki_name = re.match('(.*)\.tsv', path.split(args.i)[1]).group(1)
-    OUTPUT_FILE_NAME = '{}/{}_stats.csv'.format(args.o,wiki_name)
-    if path.isfile(OUTPUT_FILE_NAME):
-        print('{} stats file already exists'.format(wiki_name))
-        quit()
+def write_stats(fn, row):
+    '''Writes a row of stats ({column: value}) to fn'''
+    with open(fn, 'w') as f:
+        o = csv.DictWriter(f, list(row))
+        o.writeheader()
+        o.writerow(row)
 
+
+def analyze_wikis(files, args):
+    '''Analyzes each of the wikis in a pool of processes, and writes all of the
+    stats to one file as they finish. Wikis with all of the stats in their stats
+    file are not analyzed again, but their stats are included.'''
+    combined_fn = args.combined or path.join(args.o, 'all_stats.csv')
+    os.makedirs(args.o, exist_ok=True)
+    columns = [KEY_COLUMN] + selected_metrics(args)
+    with open(combined_fn, 'w') as f:
+        o = csv.DictWriter(f, columns, extrasaction='ignore')
+        o.writeheader()
+        to_analyze = []
+        for fn in files:
+            existing = existing_stats(fn, args)
+            if all(x in existing for x in columns):
+                o.writerow(existing)
+            else:
+                to_analyze.append(fn)
+        print('Analyzing {} wikis ({} already done)'.format(len(to_analyze), len(files) - len(to_analyze)))
+        with ProcessPoolExecutor(max_workers=args.j) as pool:
+            futures = {pool.submit(timed_analyze_wiki, fn, args): fn for fn in to_analyze}
+            for i, future in enumerate(as_completed(futures), 1):
+                row, error, seconds = future.result()
+                wiki_name = get_wiki_name(futures[future])
+                if error:
+                    print('[{}/{}] {} failed after {:.1f}s: {}'.format(i, len(futures), wiki_name, seconds, error))
+                    continue
+                print('[{}/{}] {} finished in {:.1f}s'.format(i, len(futures), wiki_name, seconds))
+                if row:
+                    o.writerow(row)
+                    f.flush()
+
+
+def timed_analyze_wiki(fn, args):
+    '''Runs analyze_wiki in a worker, and returns (row, error, seconds), so that one
+    failing wiki doesn't stop the others'''
+    start = time.time()
+    try:
+        row = analyze_wiki(fn, args)
+        return row, None, time.time() - start
+    except Exception as e:
+        return None, repr(e), time.time() - start
+
+
+def analyze_wiki(fn, args):
+    '''Gets the stats for a single wiki and writes them to its stats file. If
+    the file already exists and was made with the same parameters (see
+    stats_params), only the stats that aren't in it are computed, and they're
+    added to it. Returns the row of stats (as {column: value}), or None
+    if the wiki wasn't analyzed. With --profile, also writes the time taken by
+    each stage to its profile file.'''
+    os.makedirs(args.o, exist_ok=True)
+    existing = existing_stats(fn, args)
+    metrics = [x for x in selected_metrics(args) if x not in existing]
+    if not metrics and not args.edgelist:
+        print('{} stats file already has all of the stats'.format(get_wiki_name(fn)))
+        return None
+    profiling = args.profile or args.cprofile
+    if profiling:
+        nT.PROFILER = nT.Profiler(cprofile=args.cprofile)
+    try:
+        row = wiki_stats(fn, args, metrics)
+    finally:
+        if profiling:
+            nT.PROFILER.write(profile_file_name(fn, args))
+            nT.PROFILER = None
+    if row is None:
+        return None
+    row = order_stats(dict(existing, **row))
+    write_stats(output_file_name(fn, args), row)
+    with open(params_file_name(fn, args), 'w') as f:
+        json.dump(stats_params(args), f)
+    return row
+
+
+def wiki_stats(fn, args, metrics):
+    '''Returns {column: value} for the wiki name and each of the stats in
+    metrics, or None if the wiki doesn't have enough edits or users'''
+    wiki_name = get_wiki_name(fn)
     print("Analyzing {} wiki".format(wiki_name))
 
-    wiki_edits = nT.Edits(fn = args.i,
+    wiki_edits = nT.Edits(fn = fn,
             threshold = args.t,
             remove_anon = args.remove_anon,
-            cutoff_date = None)
+            cutoff_date = None,
+            cache_dir = args.cache_dir)
     wiki_edits.clean_df()
     wiki_edits.threshold_filter(
             # Function that tells which edits to count toward the threshold edits.
@@ -50,68 +266,41 @@ def main():
     # If it has enough edits, then get the stats
     d = wiki_edits.df
     if d is None:
-        print("Not enough edits in {}".format(args.i))
-        quit()
+        print("Not enough edits in {}".format(fn))
+        return None
     # Create a df of just the main ns edits
     d_main_edits = d[d['namespace'] == 0]
     # Get the edit counts by editor
     editors = d_main_edits.groupby('editor')
-    # Create networks
-    talk_net = make_network(wiki_edits, dichotomize_level=args.d)
-    if args.edgelist:
-        talk_net.write_edgelist(args.edgelist)
-        quit()
-    if not talk_net:
-        print('No users in graph for {}'.format(wiki_name))
-        quit()
-    # Get the subgraphs which only includes active editors
-    with open(OUTPUT_FILE_NAME, 'w') as f:
-        o = csv.writer(f)
-        o.writerow(['wiki.name',
-                    'main.ns.edits',
-                    'talk.ns.edits',
-                    'network.nodes',
-                    'mean.weight',
-                    'median.weight',
-                    'degree.gini',
-                    'betweenness.gini',
-                    'density',
-                    'diameter',
-                    'clustering.coef',
-                    'kcore.gt.2',
-                    'kcore.gt.1',
-                    'hierarchy',
-                    'gini.main.ns.edits.non.reverted',
-                    'founding.date'
-                    ])
-        o.writerow([wiki_name,
-                    # total edits (in main namespace)
-                    len(d_main_edits),
-                    # Talk edits 
-                    wiki_edits.num_talk_edits(),
-                    # Network size
-                    talk_net.vcount(),
-                    # Mean weight of edges
-                    talk_net.mean_weight(),
-                    talk_net.median_weight(),
-                    # Centralization measures
-                    gini(talk_net.indegree()),
-                    gini(talk_net.betweenness()),
-                    # Density
-                    talk_net.density(),
-                    # Diameter
-                    talk_net.diameter(),
-                    # Clustering
-                    talk_net.transitivity_undirected(),
-                    # Ratio of members with k-shell number greater than 2 (one measure of core-periphery)
-                    kcore_ratio(talk_net,2),
-                    kcore_ratio(talk_net,1),
-                    # Hierarchy
-                    talk_net.hierarchy(),
-                    gini(d_main_edits[d_main_edits.was_reverted == False].groupby('editor').size()),
-                    # Date of first edit
-                    d['date_time'].iloc[0],
-                    ])
+    # What the stats are computed from (see Metric)
+    inputs = {'edits': wiki_edits, 'df': d, 'main_edits': d_main_edits}
+    row = {KEY_COLUMN: wiki_name}
+    # The network is only made if it's needed
+    graph_metrics = [x for x in metrics if 'graph' in METRICS[x].inputs]
+    if graph_metrics or args.edgelist:
+        # Create networks
+        talk_net = make_network(wiki_edits, dichotomize_level=args.d, cache_dir=args.cache_dir)
+        if not talk_net:
+            print('No users in graph for {}'.format(wiki_name))
+            return None
+        if args.edgelist:
+            talk_net.write_edges(args.edgelist)
+            return None
+        row.update(network_stats(talk_net, graph_metrics, args))
+    for name in metrics:
+        if name not in row:
+            with nT.profile_stage(name):
+                row[name] = METRICS[name].func(*[inputs[x] for x in METRICS[name].inputs])
+    return row
+
+
+def network_stats(graph, names, args):
+    '''Returns {column: value} for the stats of the network in names'''
+    workers = args.metric_workers if graph.vcount() >= PARALLEL_METRICS_MIN_NODES else 1
+    # Start the slowest stats first, so the others can fill in around them
+    names = sorted(names, key=lambda x: METRICS[x].cost, reverse=True)
+    return nT.compute_metrics(graph, {x: (METRICS[x].func, METRICS[x].needs) for x in names},
+            INTERMEDIATES, max_workers=workers, executor=args.metric_executor)
 
 
 def get_betweenness(graph, editor):
@@ -125,29 +314,42 @@ def get_betweenness(graph, editor):
     except ValueError:
         return 0
 
+def all_betweenness(graph):
+    '''Returns the betweenness of every node; exact for smaller networks, and
+    estimated for larger ones'''
+    if graph.vcount() <= EXACT_BETWEENNESS_LIMIT:
+        return graph.betweenness()
+    betweenness, error = graph.betweenness(samples=BETWEENNESS_SAMPLES, seed=0, return_error=True)
+    print('Estimated betweenness from {} of {} nodes (mean standard error {:.3g})'.format(
+        BETWEENNESS_SAMPLES, graph.vcount(), sum(error) / len(error)))
+    return betweenness
+
 def get_effective_size(graph, editor):
     try:
         return graph.effective_size(editor)
     except ValueError:
         return 0
 
-def kcore_ratio(graph, k):
+def kcore_ratio(graph, k, coreness=None):
     '''Looks at the k-core value for each vertex (this is the highest k for
     which the vertex is in a subgraph where all of the vertices have at least
     k edges). Returns the proportion of vertices whose k-core value is greater
-    than k'''
-    shells = graph.coreness()
+    than k. The k-core values can be passed in as coreness, if they're already known.'''
+    shells = graph.coreness() if coreness is None else coreness
     try:
         return len([x for x in shells if x > k]) / len(shells)
     except ZeroDivisionError:
         return None
 
-def make_network(df, dichotomize_level=1):
+def make_network(df, dichotomize_level=1, cache_dir=None):
     # Put df in order by page, then edit time.
-        return nT.make_talk_network(edits = df,
-                edit_limit = EDIT_LIMIT,
+        params = dict(edit_limit = EDIT_LIMIT,
                 time_limit = TIME_LIMIT,
                 dichotomize_level=dichotomize_level)
+        if cache_dir:
+            # Reuse the network from an earlier run with the same edits and parameters
+            return nT.cached_network(df, cache_dir, nT.make_talk_network, **params)
+        return nT.make_talk_network(edits = df, **params)
 
 def gini(x):
     '''Code transferred from R reldist package (https://www.rdocumentation.org/packages/reldist/versions/1.6-6/topics/gini).
@@ -163,6 +365,72 @@ def gini(x):
     nu = nu / nu[n-1] # Normalization of values
     return (nu[1:n]*p[:n-1]).sum() - (nu[:n-1]*p[1:n]).sum()
 
+def indegree_gini(graph):
+    return gini(graph.indegree())
+
+def betweenness_gini(graph):
+    return gini(all_betweenness(graph))
+
+def kcore_gt_2(graph, coreness):
+    return kcore_ratio(graph, 2, coreness)
+
+def kcore_gt_1(graph, coreness):
+    return kcore_ratio(graph, 1, coreness)
+
+def non_reverted_gini(main_edits):
+    return gini(main_edits[main_edits.was_reverted == False].groupby('editor').size())
+
+def founding_date(d):
+    # Date of first edit
+    return d['date_time'].iloc[0]
+
+
+# A stat, computed by calling func with its inputs, which can be:
+#   'graph': the talk network
+#   'edits': the nT.Edits for the wiki
+#   'df': the cleaned edits, up to the threshold
+#   'main_edits': just the main namespace edits in df
+# Stats of the graph only take the graph, and the intermediates in needs as
+# keyword arguments. They're computed at once (see nT.compute_metrics), with
+# the most costly (i.e., slowest) first. Stats that aren't enabled are only
+# computed when they're asked for with --metrics.
+Metric = namedtuple('Metric', ['func', 'inputs', 'needs', 'cost', 'enabled'])
+Metric.__new__.__defaults__ = (('graph',), (), 1, True)
+
+# The stats, in the order of their columns in the stats files. To add a stat,
+# add it here, and rerun: only the new column is computed for wikis that have
+# already been analyzed.
+METRICS = {
+        # total edits (in main namespace)
+        'main.ns.edits': Metric(len, ('main_edits',), cost=0),
+        # Talk edits
+        'talk.ns.edits': Metric(nT.Edits.num_talk_edits, ('edits',), cost=0),
+        # Network size
+        'network.nodes': Metric(nT.EditNetwork.vcount, cost=0),
+        # Mean weight of edges
+        'mean.weight': Metric(nT.EditNetwork.mean_weight),
+        'median.weight': Metric(nT.EditNetwork.median_weight),
+        # Centralization measures
+        'degree.gini': Metric(indegree_gini),
+        'betweenness.gini': Metric(betweenness_gini, cost=100),
+        'density': Metric(nT.EditNetwork.density, cost=0),
+        'diameter': Metric(nT.EditNetwork.diameter, cost=20),
+        # Clustering
+        'clustering.coef': Metric(nT.EditNetwork.transitivity_undirected, cost=10),
+        # Ratio of members with k-shell number greater than 2 (one measure of core-periphery)
+        'kcore.gt.2': Metric(kcore_gt_2, needs=('coreness',)),
+        'kcore.gt.1': Metric(kcore_gt_1, needs=('coreness',)),
+        # Hierarchy
+        'hierarchy': Metric(nT.EditNetwork.hierarchy, cost=50),
+        'gini.main.ns.edits.non.reverted': Metric(non_reverted_gini, ('main_edits',)),
+        'founding.date': Metric(founding_date, ('df',), cost=0),
+        # Share of edges that go both ways
+        'reciprocity': Metric(nT.EditNetwork.reciprocity, enabled=False),
+        }
+
+# Values that more than one stat needs, so they're only computed once
+INTERMEDIATES = {'coreness': nT.EditNetwork.coreness}
+
 
 if __name__ == '__main__':
     main()
@@ -1,13 +1,34 @@
 import re
 import csv
+import gzip
 import datetime
 import igraph
 import sys
+import tempfile
+import os
+import json
+import hashlib
+import pickle
+import time
+import threading
+import functools
+import contextlib
+import cProfile
+import pstats
+import inspect
+import numpy as np
 from statistics import mean, median
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import pandas as pd
 import config
 
+# Increment this when the way edits are cleaned changes, so that cached
+# cleaned edits are not reused
+CACHE_VERSION = 1
+
+# Set this to a Profiler to record how long each stage of the pipeline takes
+PROFILER = None
 
 ############ Goals: ###################
 # High-level Goal
@@ -22,49 +43,342 @@ import config
 #       edits/editors/seconds of each other OR
 #       A edit's B's User_talk page => increment_edge(A,B)
 
+class Profiler:
+    '''Records how long each named stage of the pipeline takes, the peak memory
+    (RSS) used during it, and counters such as the number of edits or edges.
+    Stages can be nested, and are named by their path (e.g.,
+    'clean_df/read_edits'); a stage that runs more than once adds up its time.
+    Memory is sampled from a background thread while stages are running.
+    If cprofile is True, then the outermost stages are also run under cProfile,
+    and their slowest functions are included in the record. Only stages in the
+    thread that made the Profiler are recorded; work done in other threads or
+    processes can be added with add_stage.'''
+
+    SAMPLE_INTERVAL = 0.05 # Seconds between memory samples
+    TOP_FUNCTIONS = 25 # Number of functions to keep from each cProfile
+
+    def __init__(self, cprofile=False):
+        self.cprofile = cprofile
+        self.stages = {}
+        self.counters = {}
+        self.profiles = {}
+        self.open_stages = []
+        self.peak_rss = None
+        self.stopped = threading.Event()
+        self.sampler = None
+        self.start = time.perf_counter()
+        self.thread = threading.get_ident()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if threading.get_ident() != self.thread:
+            # The stages of other threads would get mixed up with this one's
+            yield
+            return
+        self.open_stages.append(name)
+        path = '/'.join(self.open_stages)
+        record = self.stage_record(path)
+        record['calls'] += 1
+        if self.sampler is None:
+            self.sampler = threading.Thread(target=self.sample_memory, daemon=True)
+            self.sampler.start()
+        self.sample()
+        profile = None
+        if self.cprofile and len(self.open_stages) == 1:
+            profile = self.profiles.setdefault(path, cProfile.Profile())
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] += time.perf_counter() - start
+            if profile:
+                profile.disable()
+            self.sample()
+            self.open_stages.pop()
+
+    def add_stage(self, name, seconds):
+        '''Records a stage that was run somewhere else (e.g., in another thread
+        or process) and took seconds, inside the stages that are running now'''
+        record = self.stage_record('/'.join(self.open_stages + [name]))
+        record['calls'] += 1
+        record['seconds'] += seconds
+
+    def stage_record(self, path):
+        return self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'peak_rss_mb': None})
+
+    def count(self, name, value):
+        '''Adds value to the counter called name'''
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def sample(self):
+        '''Updates the peak memory of the running stages'''
+        rss = current_rss()
+        if rss is None:
+            return
+        self.peak_rss = max(self.peak_rss or 0, rss)
+        open_stages = list(self.open_stages)
+        for i in range(1, len(open_stages) + 1):
+            record = self.stages.get('/'.join(open_stages[:i]))
+            if record is not None:
+                record['peak_rss_mb'] = max(record['peak_rss_mb'] or 0, rss)
+
+    def sample_memory(self):
+        while not self.stopped.wait(self.SAMPLE_INTERVAL):
+            self.sample()
+
+    def to_dict(self):
+        stages = {}
+        for path, record in self.stages.items():
+            record = dict(record, peak_rss_mb=to_mb(record['peak_rss_mb']))
+            if path in self.profiles:
+                record['profile'] = top_functions(self.profiles[path], self.TOP_FUNCTIONS)
+            stages[path] = record
+        return {'seconds': time.perf_counter() - self.start,
+                'stages': stages,
+                'counters': self.counters,
+                'peak_rss_mb': to_mb(self.peak_rss)}
+
+    def write(self, fn):
+        '''Stops sampling memory, and writes the record to fn as JSON'''
+        self.stopped.set()
+        with open(fn, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def profile_stage(name):
+    '''Returns a context manager that records a stage in PROFILER, if it is set'''
+    if PROFILER is None:
+        return contextlib.nullcontext()
+    return PROFILER.stage(name)
+
+
+def profiled(name):
+    '''Decorator that records each call to a function as a stage in PROFILER'''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if PROFILER is None:
+                return func(*args, **kwargs)
+            with PROFILER.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value):
+    '''Adds value to a counter in PROFILER, if it is set'''
+    if PROFILER is not None:
+        PROFILER.count(name, value)
+
+
+def add_stage(name, seconds):
+    '''Adds a stage that was run somewhere else to PROFILER, if it is set'''
+    if PROFILER is not None:
+        PROFILER.add_stage(name, seconds)
+
+
+def current_rss():
+    '''Returns the resident memory of this process in bytes, or None if it
+    can't be read (it's read from /proc, so this only works on Linux)'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def to_mb(n_bytes):
+    return None if n_bytes is None else round(n_bytes / 2**20, 1)
+
+
+def top_functions(profile, n):
+    '''Returns the n functions with the most cumulative time in a cProfile.Profile'''
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda x: x[1][3], reverse=True)[:n]
+    return [{'function': '{}:{}({})'.format(*func),
+            'calls': calls,
+            'seconds': round(total, 4),
+            'cumulative_seconds': round(cumulative, 4)}
+            for func, (_, calls, total, cumulative, _) in rows]
+
+
 class Edits:
 
     def __init__(self,
             fn,
             remove_anon = False,
             threshold = None,
-            cutoff_date = None # Ignore edits after this date
+            cutoff_date = None, # Ignore edits after this date
+            # If set, read and clean the file this many rows at a time, without
+            # ever holding all of the edits in memory (see clean_chunks)
+            chunksize = None,
+            tmp_dir = None, # Where to spill the cleaned chunks. Defaults to the system temp dir
+            # If set, store the cleaned edits in this directory, and reuse
+            # them the next time the same file is cleaned (needs pyarrow).
+            # Can't be used with chunksize, since there is no full dataframe to store.
+            cache_dir = None
             ):
+        if chunksize and cache_dir:
+            raise ValueError("cache_dir can't be used with chunksize")
 
         self.fn = fn
         self.threshold = threshold
         self.remove_anon = remove_anon
         self.cutoff_date = cutoff_date
+        self.chunksize = chunksize
+        self.tmp_dir = tmp_dir
+        self.cache_dir = cache_dir
 
     # Use the non-filtered version to find the last period of mutli-editor activity
+    @profiled('clean_df')
     def clean_df(self):
+        if self.chunksize:
+            return self.clean_chunks()
+        if self.cache_dir:
+            cache_fn = self.cache_fn()
+            if self.load_cache(cache_fn):
+                return None
         try:
-            self.df = pd.read_csv(self.fn, delimiter='\t', doublequote=False,
-                    dtype={'reverteds':object})
+            self.df = self.read_edits()
+            count('rows_read', len(self.df))
         except ValueError:
-            print("No lines in", fn)
+            print("No lines in", self.fn)
             self.df = None
+            return None
         except:
             print("Error was:", sys.exc_info()[0])
             raise
         # Mark reverted edits (want to include bot reverts since these could be spam)
         self.mark_reverted_revs()
-        # Just making it easier to refer to self.df
-        d = self.df
+        self.bot_edit_count = self.dup_edit_count = self.bad_date_count = 0
+        # Stable sort, so that edits made at the same time stay in file order
+        self.df = self.clean_edits(self.df).sort_values('date_time', kind='mergesort')
+        if self.cache_dir:
+            self.save_cache(cache_fn)
+        count('cleaned_edits', len(self.df))
+        return None
+
+    def cache_fn(self):
+        '''Returns the path (without extension) of the cache for this file. The name
+        includes a hash of the file's size, modification time and contents, the
+        config ignore lists, and the cutoff date, so a change to any of them
+        means the edits are cleaned again.'''
+        h = hashlib.blake2b(digest_size=16)
+        stat = os.stat(self.fn)
+        h.update(repr((CACHE_VERSION, stat.st_size, stat.st_mtime_ns,
+            str(self.cutoff_date), config_version())).encode())
+        with open(self.fn, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        name = os.path.splitext(os.path.basename(self.fn))[0]
+        return os.path.join(self.cache_dir, '{}_{}'.format(name, h.hexdigest()))
+
+    @profiled('load_cache')
+    def load_cache(self, cache_fn):
+        '''Loads cleaned edits saved by save_cache. Returns False if there aren't any.'''
+        if not os.path.isfile(cache_fn + '.feather'):
+            return False
+        with open(cache_fn + '.json') as f:
+            counts = json.load(f)
+        self.bot_edit_count = counts['bot_edit_count']
+        self.dup_edit_count = counts['dup_edit_count']
+        self.bad_date_count = counts['bad_date_count']
+        from pyarrow import feather
+        d = feather.read_table(cache_fn + '.feather', memory_map=True).to_pandas()
+        # The names are stored as categories; turn them back into plain strings
+        for col in ['editor', 'title']:
+            d[col] = d[col].astype(d[col].cat.categories.dtype)
+        # Same type that read_edits uses
+        d['reverteds'] = d['reverteds'].astype(object)
+        self.df = d
+        return True
+
+    @profiled('save_cache')
+    def save_cache(self, cache_fn):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(cache_fn + '.json', 'w') as f:
+            json.dump({'bot_edit_count': int(self.bot_edit_count),
+                'dup_edit_count': int(self.dup_edit_count),
+                'bad_date_count': int(self.bad_date_count)}, f)
+        # Editors and titles repeat a lot, so store them as categories
+        d = self.df.astype({'editor': 'category', 'title': 'category'})
+        # Write to a temporary file first, so a partly written cache is never loaded
+        d.reset_index(drop=True).to_feather(cache_fn + '.feather.tmp')
+        os.replace(cache_fn + '.feather.tmp', cache_fn + '.feather')
+
+    def clean_chunks(self):
+        '''Streaming version of clean_df. Reads the file self.chunksize rows at a
+        time, cleans each chunk, and spills it to disk as a run sorted by
+        (articleid, date_time). page_frames then merges the runs back together
+        a block at a time, so peak memory depends on the chunksize rather than
+        the size of the wiki. Anonymous edits are removed here, if requested,
+        since there is no full dataframe for threshold_filter to work on.'''
+        self.df = None
+        self.bot_edit_count = self.dup_edit_count = self.bad_date_count = 0
+        self.talk_edit_count = 0
+        self.run_dir = tempfile.TemporaryDirectory(dir=self.tmp_dir)
+        self.runs = []
+        # Only an empty file is skipped; errors while cleaning (e.g., a bad
+        # date) are raised, as in clean_df, rather than cutting the wiki short
+        try:
+            reader = self.read_edits(usecols=['reverteds'], chunksize=self.chunksize)
+        except pd.errors.EmptyDataError:
+            print("No lines in", self.fn)
+            return None
+        # A revision can be reverted by one in a later chunk, so find all of
+        # the reverted ids before cleaning anything
+        reverted = set()
+        with reader:
+            for chunk in reader:
+                reverted.update(reverted_ids(chunk['reverteds']))
+        with self.read_edits(chunksize=self.chunksize) as reader:
+            for chunk in reader:
+                count('rows_read', len(chunk))
+                chunk['was_reverted'] = chunk['revid'].isin(reverted)
+                d = self.clean_edits(chunk)
+                if self.remove_anon:
+                    d = d[d['anon']==False]
+                self.talk_edit_count += (d['namespace'] % 2 == 1).sum()
+                self.runs.append(self.write_run(d.sort_values(['articleid','date_time'])))
+                count('cleaned_edits', len(d))
+        return None
+
+    @profiled('read_edits')
+    def read_edits(self, **kwargs):
+        return pd.read_csv(self.fn, delimiter='\t', doublequote=False,
+                dtype={'reverteds':object}, **kwargs)
+
+    def write_run(self, d):
+        '''Writes a sorted run of edits to disk in blocks, and returns the file names'''
+        # Each run is read back one block at a time while merging, so keep
+        # the blocks small relative to the chunks
+        block_size = max(self.chunksize // 16, 1000)
+        run = []
+        for start in range(0, len(d), block_size):
+            fn = os.path.join(self.run_dir.name, '{}_{}.pkl'.format(len(self.runs), len(run)))
+            d.iloc[start:start + block_size].to_pickle(fn)
+            run.append(fn)
+        return run
+
+    @profiled('clean_edits')
+    def clean_edits(self, d):
+        '''Removes bot edits, duplicate edits, and edits with bad dates, adding
+        the number removed to the counts on this object'''
         # Find the automated edits
-        bots = d['editor'].apply(self.is_bot)
+        bots = per_editor(d['editor'], find_bots)
         # Store how many there were
-        self.bot_edit_count = len(bots)
+        self.bot_edit_count += bots.sum()
         # Remove the automated edits
         d = d[~bots]
         # Find the duplicate edits
-        dup_edits = d.apply(lambda x: (x['editor'], x['sha1']) in config.bad_sha_list, axis=1)
-        self.dup_edit_count = sum(dup_edits)
+        dup_edits = pd.MultiIndex.from_arrays([d['editor'], d['sha1']]).isin(config.bad_sha_list)
+        self.dup_edit_count += dup_edits.sum()
         d = d[~dup_edits]
         # Clean out any odd dates
         # Start by removing obvious errors (since these can break pd.to_datetime)
         good_dates = d['date_time'].str.startswith('2')
-        self.bad_date_count = len(d) - sum(good_dates)
+        self.bad_date_count += len(d) - sum(good_dates)
         d = d[good_dates]
         # Then convert to datetime
         d['date_time'] = pd.to_datetime(d['date_time'], errors="raise")
@@ -74,51 +388,90 @@ class Edits:
         d = d[good_dates]
         if self.cutoff_date != None:
             d = d[d['date_time'] < self.cutoff_date] # Pretend like data collection happened at cutoff_date
-        d = d.sort_values('date_time')
         # Anons aren't always marked correctly, so recalculate this based on whether the
         # user name is an IP address
-        d['anon'] = d.editor.apply(is_anon)
-        self.df = d
-        return None
-
-    def threshold_filter(self, filter_func = lambda x: True):
+        d['anon'] = per_editor(d['editor'], find_anons)
+        return d
+
+    @profiled('threshold_filter')
+    def threshold_filter(self, filter_func = None):
+        '''Keeps the edits up until the wiki reaches self.threshold edits that
+        count toward the threshold, or sets self.df to None if it never does.
+        filter_func tells which edits count (by default, all of them). It's called
+        once with the whole dataframe, and should return a boolean mask, e.g.,
+        lambda x: x.namespace == 0. It can also be an expression for
+        DataFrame.eval, like 'namespace == 0'. A function that only works on a
+        single edit is applied to each row instead, which is much slower.'''
+        if self.chunksize:
+            # Anonymous edits were already removed in clean_chunks
+            if self.threshold != None:
+                raise ValueError("threshold_filter needs the full edit history, so it can't be used with chunksize")
+            return None
+        # clean_df found no edits, so there's nothing to count
+        if self.df is None:
+            return None
         d = self.df
-        # Anons aren't always marked correctly, so recalculate this based on whether the
-        # user name is an IP address
-        d['anon'] = d.editor.apply(is_anon)
+        # clean_df already recalculated the anon column
         if self.remove_anon:
             d = d[d['anon']==False]
         if self.threshold == None:
             self.df = d.copy()
             return None
-        num_edits = len(d[d.apply(filter_func, axis=1)])
+        # The number of edits so far that count toward the threshold
+        num_edits = np.cumsum(edit_mask(d, filter_func))
         # Figure out if there are enough edits to meet our criteria
-        if num_edits >= self.threshold:
-            # Only grab the edits that occur before the threshold 
-            # (We do this by sorting by date and then summing the main ns edits and
-            # removing any edits whose date is greater than the Nth main ns edit
-            to_include = d.apply(filter_func, axis=1).cumsum()
-            filtered_d = d[to_include <= self.threshold].copy()
+        if len(d) and num_edits[-1] >= self.threshold:
+            # Only grab the edits that occur before the threshold
+            # (The edits are sorted by date, so this keeps everything before
+            # the edit after the Nth one that counts)
+            end = np.searchsorted(num_edits, self.threshold, side='right')
+            filtered_d = d.iloc[:end].copy()
 
             # Get the last active dates before we discard the newer edits
             self.final_edit = d['date_time'].iloc[-1]
             self.last_activity = self.get_last_active(n_days=30, n_editors = 2, min_date = filtered_d['date_time'].iloc[-1])
             d = filtered_d
             # Add quality score for each edit
-            d['quality'] = d.apply(lambda x: quality_score(x), axis = 1)
+            d['quality'] = quality_scores(d)
             self.df = d
         else:
             self.df = None
 
 
+    @profiled('get_last_active')
+    def get_last_active(self, n_days=30, n_editors=2, min_date=None):
+        '''Finds the last period of n_days in which at least n_editors different
+        editors edited the wiki, looking only at edits from min_date on. Returns the
+        time of the last edit in that period, or None if there never was one.
+
+        This slides a window back from the last edit, keeping a count of the edits
+        by each editor in the window, so each edit is added and removed at most once.'''
+        d = self.df
+        if min_date is not None:
+            d = d[d['date_time'] >= min_date]
+        times = d['date_time'].to_numpy()
+        editors = pd.factorize(d['editor'])[0].tolist()
+        window_starts = np.searchsorted(times, times - np.timedelta64(datetime.timedelta(days=n_days)),
+                side='left').tolist()
+        counts = {}
+        start = len(editors)
+        for end in range(len(editors) - 1, -1, -1):
+            # The window is the edits from window_starts[end] to end
+            if end + 1 < len(editors):
+                editor = editors[end + 1]
+                counts[editor] -= 1
+                if counts[editor] == 0:
+                    del counts[editor]
+            while start > window_starts[end]:
+                start -= 1
+                counts[editors[start]] = counts.get(editors[start], 0) + 1
+            if len(counts) >= n_editors:
+                return d['date_time'].iloc[end]
+        return None
+
+    @profiled('mark_reverted_revs')
     def mark_reverted_revs(self):
-        # Create a list of all of the reverted ids
-        temp_list = list(self.df.loc[self.df.reverteds.notna(), 'reverteds'])
-        # Some of them are actually a list of ids, so we need to split them.
-        reverteds = []
-        for x in temp_list:
-            reverteds += x.split(',')
-        self.df['was_reverted'] = self.df.revid.isin(reverteds)
+        self.df['was_reverted'] = self.df.revid.isin(reverted_ids(self.df['reverteds']))
 
 
     def is_bot(self, editor):
@@ -128,18 +481,60 @@ class Edits:
             return False
 
     def num_talk_edits(self):
+        if self.chunksize:
+            return self.talk_edit_count
         return len(self.df[self.df['namespace'] % 2 ==1])
 
-    def edits_iterator(self):
-        temp_df = self.df.sort_values(['articleid','date_time'])
-        rows = temp_df.iterrows()
-        while rows:
-            yield next(rows)[1]
+    def page_frames(self):
+        '''Yields dataframes made up of complete pages, sorted by articleid and
+        date_time. Without a chunksize, this is just the sorted self.df.'''
+        if self.chunksize:
+            yield from merge_runs(self.runs)
+        else:
+            yield self.df.sort_values(['articleid','date_time'])
+
+    def fingerprint(self):
+        '''Returns a hash of the edits as they are now (i.e., after any cleaning
+        and filtering), so that networks made from them can be cached (see
+        cached_network)'''
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr(CACHE_VERSION).encode())
+        for d in self.frames():
+            # Only the columns that edges are made from
+            d = d[[x for x in NETWORK_COLUMNS if x in d.columns]]
+            h.update(repr(list(d.columns)).encode())
+            h.update(pd.util.hash_pandas_object(d, index=False).to_numpy().tobytes())
+        return h.hexdigest()
+
+    def namespaces(self):
+        '''Returns a sorted list of the namespaces that there are edits in'''
+        return sorted(set().union(*(pd.unique(d['namespace']).tolist() for d in self.frames())))
+
+    def frames(self):
+        '''Like page_frames, but without sorting self.df, for when the order
+        doesn't matter'''
+        if self.chunksize:
+            return self.page_frames()
+        return [self.df]
+
+    def page_batches(self, sections=False):
+        '''Yields a PageBatch for each page, with the page's edits in date order.
+        The per-edit fields are slices of NumPy arrays, so no objects are created
+        for individual edits. If sections is True, then the section of each edit
+        is found from its comment.'''
+        for temp_df in self.page_frames():
+            yield from frame_batches(temp_df, sections)
+
 
 class EditNetwork(igraph.Graph):
 
-    def __init__(self):
-        super().__init__(directed=True)
+    def __init__(self, *args, **kwargs):
+        # igraph passes extra arguments when it creates new graphs from this one
+        # (e.g., in subgraph_edges, or when unpickling, where directed is the third
+        # positional argument), so only default to directed if it isn't given
+        if len(args) < 3 and 'directed' not in kwargs:
+            kwargs['directed'] = True
+        super().__init__(*args, **kwargs)
         self.temp_edges = []
 
     def median_weight(self):
@@ -151,45 +546,201 @@ class EditNetwork(igraph.Graph):
     def make_network(self, edges):
         if len(edges) == 0:
             return None
-        nodes = set([e.from_node for e in edges] + [e.to_node for e in edges])
-        nodes = list(nodes)
-        self.add_vertices(nodes)
-        self.add_edges([(e.from_node, e.to_node) for e in edges])
-        self.es['weight'] = 1
+        self.merge_edges(edges)
+
+    @profiled('merge_edges')
+    def merge_edges(self, edges):
+        '''Adds edges (and any nodes that aren't in the network yet), and
+        collapses them into the weights of the existing edges. Takes an
+        EdgeBuffer or a list of Edges.'''
+        if not isinstance(edges, EdgeBuffer):
+            edges = EdgeBuffer.from_edges(edges)
+        if len(edges) == 0:
+            return None
+        columns = edges.columns()
+        from_nodes = columns.pop('from_node').tolist()
+        to_nodes = columns.pop('to_node').tolist()
+        nodes = set(from_nodes) | set(to_nodes)
+        if self.vcount() > 0:
+            nodes -= set(self.vs['name'])
+        self.add_vertices(list(nodes))
         # for each attribute, create a list of the values, and add it
         # to the list of edges
-        for att in edges[0]._fields:
-            if att not in ['from_node', 'to_node']:
-                self.es[att] = [getattr(e, att) for e in edges]
+        user_talk = columns['edit_type'] == 'user_talk_owner'
+        attributes = {'weight': [1] * len(edges),
+                # How much of the weight comes from user talk owner edges, and the
+                # first time of the other edges, so the user talk owner edges can be
+                # taken out later (see remove_user_talk)
+                'user_talk_weight': user_talk.astype(int).tolist(),
+                'non_user_talk_from_time': missing_to_none(np.where(user_talk,
+                    np.datetime64('NaT'), columns['from_time']))}
+        for att, values in columns.items():
+            attributes[att] = missing_to_none(values)
+        self.add_edges(list(zip(from_nodes, to_nodes)), attributes=attributes)
         # Collapsing edges; any filtering should happen before this step
         self.collapse_weights()
 
+    @profiled('make_network_from_arrays')
+    def make_network_from_arrays(self, from_nodes, to_nodes, attributes):
+        '''Array-based version of make_network. Takes arrays of node names and a dict
+        of arrays of edge attributes (e.g., from EdgeBuffer.columns). The node names are
+        turned into integer ids and duplicate edges are collapsed with NumPy, so
+        igraph only ever sees one edge for each pair of nodes. Missing values should
+        be NaN (or NaT). Gives the same weights and attributes as collapse_weights.'''
+        if len(from_nodes) == 0:
+            return None
+        n_edges = len(from_nodes)
+        ids, names = pd.factorize(np.concatenate([from_nodes, to_nodes]))
+        key = ids[:n_edges] * len(names) + ids[n_edges:]
+        # A stable sort keeps the edges for each pair in order, for the 'first' attributes
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        self.add_vertices(list(names))
+        self.add_edges(list(zip((key[starts] // len(names)).tolist(),
+            (key[starts] % len(names)).tolist())))
+        # Weights are floats, as they are after igraph sums them
+        if 'weight' in attributes:
+            weight = np.add.reduceat(attributes['weight'][order], starts)
+        else:
+            weight = np.diff(np.r_[starts, n_edges])
+        self.es['weight'] = weight.astype(float).tolist()
+        if 'edit_type' in attributes:
+            user_talk = attributes['edit_type'][order] == 'user_talk_owner'
+            self.es['user_talk_weight'] = np.add.reduceat(user_talk, starts).astype(float).tolist()
+            if 'from_time' in attributes:
+                self.es['non_user_talk_from_time'] = missing_to_none(np.fmin.reduceat(
+                    np.where(user_talk, np.datetime64('NaT'), attributes['from_time'][order]), starts))
+        # Same rules as collapse_weights; np.fmin skips missing values, like min_with_none
+        combine = {'from_time': 'min',
+            'from_anon': 'first',
+            'to_anon': 'first',
+            'timediff': 'min',
+            'intermediate_edits': 'min',
+            'intermediate_editors': 'min'
+            }
+        for att, values in attributes.items():
+            if att not in combine:
+                continue
+            values = values[order]
+            if combine[att] == 'first':
+                self.es[att] = values[starts].tolist()
+            else:
+                self.es[att] = missing_to_none(np.fmin.reduceat(values, starts))
+
     def subgraph(self, vertices):
-        v_names = [x['name'] for x in self.vs()]
-        return self.induced_subgraph([v for v in vertices if v in v_names])
+        '''Returns the subgraph induced by the named vertices, skipping names that
+        aren't in the network'''
+        index = {name: i for i, name in enumerate(self.vs['name'])} if self.vcount() > 0 else {}
+        return self.induced_subgraph([index[v] for v in vertices if v in index])
 
     def get_edgelist_with_atts(self):
         '''Writes out an edgelist, followed by edge attributes'''
-        output = []
-        # Get attribute names from first edge
-        attributes = sorted(self.es[0].attribute_names())
-        for e in self.es:
-            output.append([self.vs[e.source]['name'], #Name of the source node
-                self.vs[e.target]['name']] + # Name of the target node
-                [e.attributes()[x] for x in attributes]) # All of the attributes
-        return {'header':['from_node','to_node'] + attributes, 'data':output}
+        attributes = sorted(self.es.attribute_names())
+        names = self.vs['name'] if self.vcount() > 0 else []
+        edgelist = self.get_edgelist()
+        # Pull out whole columns at once, rather than going edge by edge
+        columns = [[names[a] for a, _ in edgelist], # Name of the source node
+                [names[b] for _, b in edgelist]] + [ # Name of the target node
+                self.es[x] for x in attributes] # All of the attributes
+        return {'header':['from_node','to_node'] + attributes, 'data':[list(x) for x in zip(*columns)]}
+
+    def edge_columns(self):
+        '''Returns a dict of arrays, with the names of the nodes of each edge
+        (from_node and to_node) and each of the edge attributes. Missing values
+        are NaN (or NaT), so whole number attributes that can be missing are
+        floats (see EDGE_ATTRIBUTE_TYPES).'''
+        names = np.array(self.vs['name'] if self.vcount() > 0 else [], dtype=object)
+        edges = np.array(self.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+        columns = {'from_node': names[edges[:, 0]], 'to_node': names[edges[:, 1]]}
+        for att in sorted(self.es.attribute_names()):
+            columns[att] = attribute_array(self.es[att], EDGE_ATTRIBUTE_TYPES.get(att))
+        return columns
+
+    @profiled('write_edges')
+    def write_edges(self, fn, block_size=100000):
+        '''Saves the edges, with the names of their nodes and all of their
+        attributes, so that read_edges can load the network again. The format
+        comes from the extension of fn: .tsv (or .tsv.gz, which is gzipped),
+        .parquet (needs pyarrow) or .npz. tsv and parquet files are written
+        block_size edges at a time.'''
+        columns = self.edge_columns()
+        n_edges = len(columns['from_node'])
+        blocks = range(0, max(n_edges, 1), block_size)
+        if fn.endswith('.npz'):
+            np.savez_compressed(fn, directed=self.is_directed(),
+                    **{att: values.astype(str) if values.dtype == object else values
+                        for att, values in columns.items()})
+        elif fn.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            writer = None
+            for start in blocks:
+                block = pa.table({att: pa.array(values[start:start + block_size],
+                    # Node names are always strings, even when there aren't any edges
+                    type=pa.string() if values.dtype == object else None, from_pandas=True)
+                    for att, values in columns.items()})
+                if writer is None:
+                    schema = block.schema.with_metadata({'directed': json.dumps(self.is_directed())})
+                    writer = pq.ParquetWriter(fn, schema)
+                writer.write_table(block.cast(schema))
+            writer.close()
+        else:
+            with (gzip.open(fn, 'wt', newline='') if fn.endswith('.gz') else open(fn, 'w', newline='')) as f:
+                for start in blocks:
+                    block = pd.DataFrame({att: tsv_column(values[start:start + block_size])
+                        for att, values in columns.items()})
+                    block.to_csv(f, sep='\t', index=False, header=start == 0)
+
+    @staticmethod
+    @profiled('read_edges')
+    def read_edges(fn, directed=True):
+        '''Loads a network saved with write_edges, without making the edges again.
+        directed is only used for tsv files; the other formats store it. Nodes
+        without any edges aren't saved, so they aren't in the loaded network.'''
+        if fn.endswith('.npz'):
+            with np.load(fn) as f:
+                directed = bool(f['directed'])
+                columns = {att: f[att] for att in f.files if att != 'directed'}
+            for att in ['from_node', 'to_node']:
+                columns[att] = columns[att].astype(object)
+        elif fn.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            table = pq.read_table(fn)
+            directed = json.loads(table.schema.metadata[b'directed'])
+            columns = {att: table.column(att).to_numpy() for att in table.column_names}
+            # Parquet only keeps times to the millisecond or finer
+            for att in columns:
+                if isinstance(EDGE_ATTRIBUTE_TYPES.get(att), str):
+                    columns[att] = columns[att].astype(EDGE_ATTRIBUTE_TYPES[att])
+        else:
+            d = pd.read_csv(fn, sep='\t', dtype=str, keep_default_na=False)
+            # Names are always strings, even if they all look like numbers
+            columns = {att: d[att].to_numpy(dtype=object) if att in ['from_node', 'to_node']
+                    else from_tsv_column(d[att], EDGE_ATTRIBUTE_TYPES.get(att)) for att in d.columns}
+        from_nodes = columns.pop('from_node')
+        to_nodes = columns.pop('to_node')
+        n_edges = len(from_nodes)
+        ids, names = pd.factorize(np.concatenate([from_nodes, to_nodes]))
+        network = EditNetwork(directed=directed)
+        network.add_vertices(list(names))
+        network.add_edges(list(zip(ids[:n_edges].tolist(), ids[n_edges:].tolist())))
+        for att, values in columns.items():
+            if EDGE_ATTRIBUTE_TYPES.get(att) is int or values.dtype.kind in 'mM':
+                network.es[att] = missing_to_none(values)
+            else:
+                network.es[att] = values.tolist()
+        return network
 
 
+    @profiled('collapse_weights')
     def collapse_weights(self):
         # This will combine edges, summing the weights,
         # adding the minimum time, and simplifying the attributes
-
-        def min_with_none(x):
-            filtered_list = [y for y in x if y is not None]
-            return min(filtered_list) if filtered_list else None
-
         self.simplify(combine_edges={'weight':'sum',
+            'user_talk_weight': 'sum',
             'from_time':'min',
+            'non_user_talk_from_time': min_with_none,
             'from_anon': 'first',
             'to_anon': 'first',
             'timediff': min_with_none,
@@ -201,22 +752,65 @@ class EditNetwork(igraph.Graph):
     def make_undirected(self):
         '''Makes a graph undirected and sums the weights'''
         self.to_undirected(combine_edges={'weight':'sum',
+            'user_talk_weight': 'sum',
             # There is a bug here - when making undirected, the from and to nodes can be
             # switched, so anonymity is not preserved.
             'from_anon':'first',
             'to_anon':'first',
-            'from_time':'min'})
-
-
+            'from_time':'min',
+            'non_user_talk_from_time': min_with_none})
+
+
+    def remove_user_talk(self, min_weight=1):
+        '''Takes out the weight that comes from editors writing on other users' talk
+        pages (user_talk_owner edges), and deletes the edges with less than min_weight
+        left, along with any nodes that are left without edges. from_time becomes
+        the time of the first of the other edges. Changes the network in place,
+        rather than rebuilding it, and returns it.'''
+        if self.ecount() == 0:
+            return self
+        weight = np.array(self.es['weight']) - np.array(self.es['user_talk_weight'])
+        self.es['weight'] = weight.tolist()
+        self.es['user_talk_weight'] = [0.0] * self.ecount()
+        if 'non_user_talk_from_time' in self.es.attribute_names():
+            self.es['from_time'] = self.es['non_user_talk_from_time']
+        self.delete_edges(np.flatnonzero(weight < min_weight).tolist())
+        self.delete_vertices(np.flatnonzero(np.array(self.degree()) == 0).tolist())
+        return self
+
+    @profiled('dichotomize')
     def dichotomize(self, threshhold = 1):
-        edges_to_keep = [e for e in self.es if e['weight'] >= threshhold]
-        temp = self.subgraph_edges(edges_to_keep)
+        if self.ecount() == 0:
+            return self.subgraph_edges([])
+        temp = self.subgraph_edges(self.es.select(weight_ge=threshhold).indices)
         #temp.es['weight'] = 1
         return temp
 
-    def betweenness(self, vertices=None, normalized=True):
+    def dichotomize_many(self, thresholds):
+        '''Returns a dict with the dichotomized network for each threshold. The
+        edges are sorted by weight once, so the edges for each threshold are just
+        the heaviest k edges.'''
+        weights = np.array(self.es['weight'] if self.ecount() > 0 else [], dtype=float)
+        order = np.argsort(-weights, kind='stable')
+        sorted_weights = -weights[order]
+        networks = {}
+        for threshhold in thresholds:
+            k = np.searchsorted(sorted_weights, -threshhold, side='right')
+            networks[threshhold] = self.subgraph_edges(np.sort(order[:k]).tolist())
+        return networks
+
+    def betweenness(self, vertices=None, normalized=True, samples=None, seed=None,
+            return_error=False):
         '''Takes a single vertex or list of vertices, and returns the betweenness from igraph.
-        If normalized == True, then normalizes based on the constant used by ipython in R'''
+        If normalized == True, then normalizes based on the constant used by ipython in R.
+
+        Exact betweenness takes O(nm) time. If samples is given (and is less than the
+        number of nodes), then the betweenness is estimated from the shortest paths
+        that start at that many randomly chosen pivot nodes, scaled up by n/samples
+        (Brandes and Pich, 2007). seed makes the choice of pivots repeatable.
+        If return_error == True, returns (betweenness, error), where error is the
+        estimated standard error of each value (0 when the betweenness is exact),
+        normalized in the same way.'''
 
         def normalize_val(x):
             # This is the normalization used by ipython in R (http://igraph.org/r/doc/betweenness.html)
@@ -229,18 +823,47 @@ class EditNetwork(igraph.Graph):
             #print('Converting to binary network for betweeness centrality')
             #self.dichotomize()
 
-        non_normalized_betweenness = super(EditNetwork, self).betweenness(vertices=vertices)
         n = self.vcount()
+        if samples and samples < n:
+            non_normalized_betweenness, error = self.sampled_betweenness(vertices, samples, seed)
+        else:
+            non_normalized_betweenness = super(EditNetwork, self).betweenness(vertices=vertices)
+            error = 0 if isinstance(non_normalized_betweenness, float) else [0] * len(non_normalized_betweenness)
 
         if normalized == True:
             try:
                 # If it's just a float, then normalize and return
-                return normalize_val(non_normalized_betweenness)
+                result = normalize_val(non_normalized_betweenness), normalize_val(error)
             except TypeError:
                 # Otherwise, normalize the whole list, and return
-                return [normalize_val(x) for x in non_normalized_betweenness]
+                result = ([normalize_val(x) for x in non_normalized_betweenness],
+                        [normalize_val(x) for x in error])
         else:
-            return non_normalized_betweenness
+            result = non_normalized_betweenness, error
+        return result if return_error else result[0]
+
+    def sampled_betweenness(self, vertices, samples, seed=None):
+        '''Estimates the (non-normalized) betweenness from the shortest paths starting
+        at a random sample of pivot nodes. The pivots are split into groups, and the
+        spread of the groups' estimates gives the standard error of the estimate.
+        Returns (betweenness, error), as floats for a single vertex or lists otherwise.'''
+        n = self.vcount()
+        pivots = np.random.default_rng(seed).choice(n, size=samples, replace=False)
+        # Betweenness is a sum over the source nodes, so each group's sum is
+        # scaled up to an estimate of the whole thing
+        groups = [x for x in np.array_split(pivots, min(10, samples)) if len(x)]
+        estimates = np.array([np.atleast_1d(super(EditNetwork, self).betweenness(
+                vertices=vertices, sources=group.tolist())) * n / len(group)
+                for group in groups])
+        betweenness = estimates.T @ np.array([len(x) for x in groups]) / samples
+        if len(groups) > 1:
+            error = estimates.std(axis=0, ddof=1) / np.sqrt(len(groups))
+        else:
+            error = np.full(betweenness.shape, np.nan)
+        # Like igraph, a single vertex is an id or a name, and anything else is many
+        if isinstance(vertices, (int, np.integer, str)):
+            return float(betweenness[0]), float(error[0])
+        return betweenness.tolist(), error.tolist()
 
     def hierarchy(self):
         '''Returns the hierarchy measure created by Krackhardt(1994) for the graph.
@@ -249,22 +872,34 @@ class EditNetwork(igraph.Graph):
         from v_j to v_i.'''
         if not self.is_directed():
             raise ValueError("Hierarchy measure is only available on directed networks")
-        # Get the shortest paths (this tells us whether there is a path between any two nodes)
-        p = self.shortest_paths()
-        # Number of hierarchical paths (non-cycles)
+        # Nodes in the same strongly connected component can all reach each other,
+        # so every ordered pair of them is a cyclical path
+        components = self.connected_components(mode='strong')
+        sizes = components.sizes()
+        cycles = sum(s * (s - 1) for s in sizes)
+        # Every other path goes between components, and is hierarchical. Those are
+        # found on the condensation, which is acyclic, so each component's reachable
+        # set is the union of its successors' sets. Sets are bitsets (Python ints)
+        # with one bit for each node, and each component's nodes are contiguous.
+        membership = np.array(components.membership)
+        edges = np.array(self.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+        edges = membership[edges]
+        edges = np.unique(edges[edges[:, 0] != edges[:, 1]], axis=0)
+        dag = igraph.Graph(n=len(sizes), edges=edges.tolist(), directed=True)
+        offsets = np.cumsum([0] + sizes[:-1]).tolist()
+        reachable = [0] * len(sizes)
+        # A component's set is only needed until all its predecessors have used it
+        remaining = dag.indegree()
         h_paths = 0
-        # Number of cyclical paths 
-        cycles = 0
-        for i in range(len(p)):
-            for j in range(len(p)):
-                # Check if a path exists between the nodes
-                if i != j and p[i][j] != float('inf'):
-                    # If it does, and the reciprocal path also exist, increment the cycle count
-                    if p[j][i] < float('inf'):
-                        cycles += 1
-                    else:
-                        # Otherwise, increment the h_paths count
-                        h_paths += 1
+        for c in reversed(dag.topological_sorting(mode='out')):
+            for d in dag.successors(c):
+                reachable[c] |= reachable[d] | ((1 << sizes[d]) - 1) << offsets[d]
+                remaining[d] -= 1
+                if remaining[d] == 0:
+                    reachable[d] = 0
+            h_paths += sizes[c] * reachable[c].bit_count()
+            if remaining[c] == 0:
+                reachable[c] = 0
         # Return the ratio of h_paths
         if h_paths == cycles == 0:
             return None
@@ -284,8 +919,8 @@ def make_coedit_network(
         # To get just the main ns, use lambda x: x == 0
         namespace_filter=lambda x: x % 2 == 0,
         **kwargs): # Additional arguments to pass to make_network
-    kwargs['edits'] = (x for x in kwargs['edits'] if namespace_filter(x['namespace']))
-    network = make_network(**kwargs)
+    network = make_network(namespace_filter = namespace_filter,
+            **kwargs)
     return network
 
 def make_talk_network(namespace_filter=lambda x: x % 2 == 1,
@@ -295,16 +930,20 @@ def make_talk_network(namespace_filter=lambda x: x % 2 == 1,
         **kwargs):
     network = make_network(namespace_filter = namespace_filter,
             **kwargs)
-    if not include_user_talk:
-        network = network.remove_user_talk()
+    if network is not None and not include_user_talk:
+        # Edges that are only left because of user talk edits are dropped, too
+        network = network.remove_user_talk(min_weight=kwargs.get('dichotomize_level', 1))
+        if network.vcount() == 0:
+            return None
     return network
 
 def make_collaboration_network(namespace_filter=lambda x: x % 2 == 0,
         **kwargs):
-    # TODO: Add filter to only collaborative edits
-    kwargs['edits'] = (x for x in kwargs['edits'] if namespace_filter(x['namespace']))
-    network = make_network(**kwargs)
-    network = network.only_collaborative_edits()
+    # Only the edges to editors who came back after the other editor are kept.
+    # They're filtered as they're made, so the others are never stored.
+    network = make_network(namespace_filter = namespace_filter,
+            edit_types = ['collaborative'],
+            **kwargs)
     return network
 
 Edge = namedtuple('Edge', ['from_node',
@@ -314,17 +953,139 @@ Edge = namedtuple('Edge', ['from_node',
                             'edit_type',
                             'timediff',
                             'intermediate_edits',
-                            'intermediate_editors'])
+                            'intermediate_editors',
+                            # When the edit that created the edge was made
+                            'from_time'])
 Edge.__new__.__defaults__ = (None,) * len(Edge._fields)
 
+# EdgeBuffers store edit types as codes, which index into this list
+EDIT_TYPES = ['normal', 'collaborative', 'user_talk_owner']
+NORMAL, COLLABORATIVE, USER_TALK_OWNER = range(len(EDIT_TYPES))
+# Marks a missing value in an integer column of an EdgeBuffer. It's the value
+# that NumPy uses for NaT, so the time columns can be viewed as times directly.
+MISSING = np.iinfo(np.int64).min
+
+
+class EdgeBuffer:
+    '''Stores edges as one NumPy array for each Edge field, rather than as a
+    list of Edges, which takes a fraction of the memory for large networks.
+    edit_type is stored as a code (see EDIT_TYPES), timediff and from_time as
+    int64 seconds, and missing values as MISSING. The arrays grow by whole
+    chunks, so adding edges is cheap on average.'''
+
+    FIELDS = {'from_node': object,
+            'to_node': object,
+            'from_anon': bool,
+            'to_anon': bool,
+            'edit_type': np.int8,
+            'timediff': np.int64,
+            'intermediate_edits': np.int64,
+            'intermediate_editors': np.int64,
+            'from_time': np.int64}
+    CHUNK_SIZE = 2 ** 16
 
+    def __init__(self):
+        self.size = 0
+        self.arrays = {field: np.empty(self.CHUNK_SIZE, dtype=dtype)
+                for field, dtype in self.FIELDS.items()}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, field):
+        return self.arrays[field][:self.size]
+
+    def __iter__(self):
+        return iter(self.edges())
+
+    def extend(self, **columns):
+        '''Adds edges. Takes a list or array for each field; the integer fields
+        that are left out are MISSING.'''
+        n = len(columns['from_node'])
+        capacity = len(self.arrays['from_node'])
+        if self.size + n > capacity:
+            capacity = max(2 * capacity, self.size + n)
+            capacity = -(-capacity // self.CHUNK_SIZE) * self.CHUNK_SIZE
+            for field, values in self.arrays.items():
+                grown = np.empty(capacity, dtype=values.dtype)
+                grown[:self.size] = values[:self.size]
+                self.arrays[field] = grown
+        for field, values in self.arrays.items():
+            values[self.size:self.size + n] = columns.get(field, MISSING)
+        self.size += n
+
+    def add(self, other):
+        '''Adds the edges in another EdgeBuffer'''
+        self.extend(**{field: other[field] for field in self.FIELDS})
+
+    def take(self, indices):
+        '''Returns a new EdgeBuffer with the edges at indices (an array or a slice)'''
+        taken = EdgeBuffer()
+        taken.extend(**{field: self[field][indices] for field in self.FIELDS})
+        return taken
+
+    def columns(self):
+        '''Returns a dict with an array for each field, in the form that
+        EditNetwork.make_network_from_arrays takes: edit types are names, times
+        are timedelta64/datetime64, and missing values are NaN or NaT.'''
+        columns = {field: self[field] for field in self.FIELDS}
+        columns['edit_type'] = np.array(EDIT_TYPES, dtype=object)[columns['edit_type']]
+        columns['timediff'] = columns['timediff'].view('timedelta64[s]')
+        columns['from_time'] = columns['from_time'].view('datetime64[s]')
+        for field in ['intermediate_edits', 'intermediate_editors']:
+            values = columns[field]
+            columns[field] = np.where(values == MISSING, np.nan, values)
+        return columns
+
+    def edges(self):
+        '''Returns the edges as a list of Edges, with None for missing values'''
+        columns = self.columns()
+        return [Edge(*x) for x in zip(*[missing_to_none(columns[field]) for field in Edge._fields])]
+
+    @staticmethod
+    def from_edges(edges):
+        '''Makes an EdgeBuffer from a list of Edges'''
+        buffer = EdgeBuffer()
+        if len(edges) == 0:
+            return buffer
+        columns = dict(zip(Edge._fields, map(list, zip(*edges))))
+        columns['edit_type'] = [EDIT_TYPES.index(x) for x in columns['edit_type']]
+        # None becomes NaT, which is the same as MISSING
+        columns['timediff'] = np.array(columns['timediff'], dtype='timedelta64[s]').view(np.int64)
+        columns['from_time'] = np.array(columns['from_time'], dtype='datetime64[s]').view(np.int64)
+        for field in ['intermediate_edits', 'intermediate_editors']:
+            columns[field] = [MISSING if x is None else x for x in columns[field]]
+        buffer.extend(**columns)
+        return buffer
+
+
+# The edits to a single page. articleid, namespace, and title are single values,
+# and the rest are arrays with one entry per edit. If sections are asked for,
+# section has the id of each edit's section (or -1 if it doesn't have one), and
+# section_names has the name for each id.
+PageBatch = namedtuple('PageBatch', ['articleid',
+                            'namespace',
+                            'title',
+                            'editor',
+                            'anon',
+                            'date_time',
+                            'comment',
+                            'section',
+                            'section_names'])
+PageBatch.__new__.__defaults__ = (None, None)
+
+
+@profiled('make_network')
 def make_network(edits,
         edit_limit=None,
         editor_limit=None,
         time_limit=None,
         section_filter=False,
         dichotomize_level=1,
-        namespace_filter = lambda x: True
+        namespace_filter = lambda x: True,
+        engine='python',
+        backend='igraph',
+        edit_types=None
         ):
     '''
     Creates a network object based on co-edits on the same page. Takes an Edit object.
@@ -335,49 +1096,340 @@ def make_network(edits,
     time_limit creates edges with all editors who have edited in the last N days.
     By default, there are no limits, and edges are created/incremented with all
     other contributors to the page.
+    engine chooses how the edges are generated: 'python' walks each page's edits
+    in a nested loop, while 'vectorized' computes the same edges from the cleaned
+    Edits.df with array operations (see vectorized_edges).
+    backend chooses how duplicate edges are collapsed: 'igraph' adds every edge to
+    the graph and then simplifies it, while 'arrays' collapses them with NumPy first
+    (see EditNetwork.make_network_from_arrays), which uses much less memory.
+    edit_types is a list of the types of edges to keep (see EDIT_TYPES); by
+    default, all of them are kept.
     '''
+    all_edges = make_edges(edits,
+            edit_limit=edit_limit,
+            editor_limit=editor_limit,
+            time_limit=time_limit,
+            section_filter=section_filter,
+            namespace_filter=namespace_filter,
+            engine=engine,
+            edit_types=edit_types)
+    return network_from_edges(all_edges, dichotomize_level, backend)
+
+
+# The networks that make_networks can make: the namespaces and edge types
+# that each is made from, as in make_coedit_network, etc.
+NETWORK_TYPES = {'coedit': (lambda x: x % 2 == 0, None),
+        'collaboration': (lambda x: x % 2 == 0, ['collaborative']),
+        'talk': (lambda x: x % 2 == 1, None)}
+
+
+@profiled('make_networks')
+def make_networks(edits,
+        network_types=('coedit', 'collaboration', 'talk'),
+        dichotomize_level=1,
+        backend='igraph',
+        **kwargs # Additional arguments to pass to frame_edges
+        ):
+    '''Makes several kinds of network (see NETWORK_TYPES) from one pass over the
+    edits, and returns a dict of them. Each network is the same as the one made by
+    make_coedit_network, make_collaboration_network, or make_talk_network (with
+    include_user_talk=True). The edges for a set of namespaces are only made once,
+    so, e.g., the coedit and collaboration networks share their edges.'''
+    time_limit = kwargs.pop('time_limit', None)
+    kwargs['time_limit'] = np.timedelta64(datetime.timedelta(days = time_limit)) if time_limit else None
+    edges = {name: EdgeBuffer() for name in network_types}
+    for d in edits.page_frames():
+        namespaces = pd.unique(d['namespace'])
+        frame_edges_by_namespaces = {}
+        for name in network_types:
+            namespace_filter, edit_types = NETWORK_TYPES[name]
+            chosen = tuple(x for x in namespaces if namespace_filter(x))
+            if chosen not in frame_edges_by_namespaces:
+                frame_edges_by_namespaces[chosen] = frame_edges(d[d['namespace'].isin(chosen)], **kwargs)
+            edges[name].add(filter_edit_types(frame_edges_by_namespaces[chosen], edit_types))
+    return {name: network_from_edges(edges[name], dichotomize_level, backend) for name in network_types}
+
+
+def network_from_edges(edges, dichotomize_level=1, backend='igraph'):
+    '''Collapses an EdgeBuffer into an EditNetwork and dichotomizes it (see
+    make_network). Returns None if the network is empty.'''
+    network = EditNetwork()
+    if backend == 'arrays':
+        columns = edges.columns()
+        network.make_network_from_arrays(columns.pop('from_node'), columns.pop('to_node'), columns)
+    elif backend == 'igraph':
+        network.make_network(edges)
+    else:
+        raise ValueError("Unknown backend: {}".format(backend))
+    network = network.dichotomize(dichotomize_level)
+    count('network_nodes', network.vcount())
+    count('network_edges', network.ecount())
+    if len(network.vs) == 0:
+        return None
+    return network
+
+
+@profiled('cached_network')
+def cached_network(edits,
+        cache_dir,
+        make=make_network, # e.g., make_talk_network
+        **kwargs # Additional arguments to pass to make
+        ):
+    '''Returns make(edits=edits, **kwargs), saving the network in cache_dir so that
+    the next call with the same edits and arguments loads it instead of making
+    it again. Like make, returns None if the network is empty.'''
+    cache_fn = network_cache_fn(edits, cache_dir, make, kwargs)
+    if os.path.isfile(cache_fn):
+        count('network_cache_hits', 1)
+        network = EditNetwork.read_edges(cache_fn)
+        return network if network.vcount() > 0 else None
+    network = make(edits=edits, **kwargs)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first, so a partly written network is never loaded
+    tmp_fn = cache_fn[:-len('.npz')] + '.tmp.npz'
+    (network if network is not None else EditNetwork()).write_edges(tmp_fn)
+    os.replace(tmp_fn, cache_fn)
+    return network
+
+
+def network_cache_fn(edits, cache_dir, make, kwargs):
+    '''Returns the path of the cached network for cached_network. The name
+    includes a hash of the edits and all of the arguments to make (including
+    its defaults). Namespace filters are functions, so they're stored as the
+    namespaces that they let through. engine and backend give the same
+    networks, so they're left out.'''
+    params = inspect.signature(make).bind_partial(**kwargs)
+    params.apply_defaults()
+    key = {}
+    for name, value in params.arguments.items():
+        if params.signature.parameters[name].kind == inspect.Parameter.VAR_KEYWORD:
+            key.update(value)
+        else:
+            key[name] = value
+    for name in ['engine', 'backend']:
+        key.pop(name, None)
+    if 'namespace_filter' in key:
+        key['namespace_filter'] = [x for x in edits.namespaces() if key['namespace_filter'](x)]
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((CACHE_VERSION, edits.fingerprint(), make.__name__, sorted(key.items()))).encode())
+    name = os.path.splitext(os.path.basename(edits.fn))[0] if edits.fn else 'edits'
+    return os.path.join(cache_dir, '{}_{}_{}.npz'.format(name, make.__name__, h.hexdigest()))
+
+
+@profiled('compute_metrics')
+def compute_metrics(network,
+        metrics, # {name: (function, names of the intermediates it needs)}
+        intermediates=None, # {name: function}
+        max_workers=None, # Defaults to the number of cores
+        executor='process',
+        mp_context=None # multiprocessing context for the processes, e.g., to use spawn
+        ):
+    '''Computes several metrics of a network at once, and returns {name: value}.
+    Each metric's function is called with the network, and the intermediates
+    that it needs as keyword arguments (e.g., both k-core ratios need the
+    network's coreness). Each intermediate is only computed once: metrics that
+    share intermediates are computed together, in the same worker.
+    The groups of metrics are spread over a pool of processes, or threads if
+    executor is 'thread'. Threads don't need to copy the network, but most of
+    igraph holds the GIL, so processes are usually faster. The functions have
+    to be picklable to use processes (e.g., not lambdas). With max_workers=1,
+    the metrics are computed here, one after another.'''
+    intermediates = intermediates or {}
+    groups = metric_groups(metrics)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(groups))
+    if max_workers <= 1:
+        results = [run_metrics(network, group, intermediates) for group in groups]
+    elif executor == 'thread':
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(run_metrics, network, group, intermediates) for group in groups]
+            results = [future.result() for future in futures]
+    elif executor == 'process':
+        # Each worker gets the network once, rather than with every group (when
+        # processes are forked, it isn't even pickled)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                initializer=set_worker_network, initargs=(network,)) as pool:
+            futures = [pool.submit(run_worker_metrics, group, intermediates) for group in groups]
+            results = [future.result() for future in futures]
+    else:
+        raise ValueError("Unknown executor: {}".format(executor))
+    values = {}
+    for group_values, seconds in results:
+        values.update(group_values)
+        for name, x in seconds.items():
+            add_stage(name, x)
+    return {name: values[name] for name in metrics}
+
+
+def metric_groups(metrics):
+    '''Splits metrics (see compute_metrics) into groups, so that metrics which
+    need the same intermediate are in the same group'''
+    groups = []
+    for name, (func, needs) in metrics.items():
+        group = {'metrics': {}, 'needs': set(needs)}
+        for other in [x for x in groups if x['needs'] & group['needs']]:
+            group['metrics'].update(other['metrics'])
+            group['needs'] |= other['needs']
+            groups.remove(other)
+        group['metrics'][name] = (func, needs)
+        groups.append(group)
+    return [x['metrics'] for x in groups]
+
+
+# The network that a worker process computes metrics of (see compute_metrics)
+WORKER_NETWORK = None
+
+
+def set_worker_network(network):
+    global WORKER_NETWORK
+    WORKER_NETWORK = network
+
+
+def run_worker_metrics(metrics, intermediates):
+    return run_metrics(WORKER_NETWORK, metrics, intermediates)
+
+
+def run_metrics(network, metrics, intermediates):
+    '''Computes a group of metrics and the intermediates that they need. Returns
+    ({name: value}, {name: seconds}), where the times include the intermediates.'''
+    values = {}
+    seconds = {}
+    computed = {}
+    for name, (func, needs) in metrics.items():
+        for x in needs:
+            if x not in computed:
+                start = time.perf_counter()
+                computed[x] = intermediates[x](network)
+                seconds[x] = time.perf_counter() - start
+        start = time.perf_counter()
+        values[name] = func(network, **{x: computed[x] for x in needs})
+        seconds[name] = time.perf_counter() - start
+    return values, seconds
+
+
+def make_network_snapshots(edits,
+        cutoff_dates,
+        dichotomize_level=1,
+        **kwargs # Additional arguments to pass to make_edges
+        ):
+    '''Yields (cutoff_date, network) pairs, where each network is the one that
+    make_network would create from just the edits before cutoff_date. cutoff_dates
+    is either a list of dates, or a pandas frequency string (e.g., '90D' or 'MS'),
+    which creates cutoffs at that interval from the first edit to the last.
+
+    An edge only depends on the edits up to the edit that creates it, so the edits
+    before a cutoff create exactly the edges with a from_time before the cutoff.
+    This creates all of the edges once, and then adds them to the network in
+    order of from_time, so the snapshots cost about the same as one network.'''
+    edges = make_edges(edits, **kwargs)
+    edges = edges.take(np.argsort(edges['from_time'], kind='stable'))
+    from_times = edges['from_time'].view('datetime64[s]')
+    if isinstance(cutoff_dates, str):
+        if len(edges) == 0:
+            return
+        cutoff_dates = pd.date_range(from_times[0], from_times[-1], freq=cutoff_dates)
+    network = EditNetwork()
+    start = 0
+    for cutoff_date in sorted(cutoff_dates):
+        end = np.searchsorted(from_times, np.datetime64(pd.Timestamp(cutoff_date)), side='left')
+        network.merge_edges(edges.take(slice(start, end)))
+        start = max(start, end)
+        snapshot = network.dichotomize(dichotomize_level)
+        yield cutoff_date, (snapshot if len(snapshot.vs) > 0 else None)
+
+
+@profiled('make_edges')
+def make_edges(edits,
+        edit_limit=None,
+        editor_limit=None,
+        time_limit=None,
+        section_filter=False,
+        namespace_filter = lambda x: True,
+        engine='python',
+        edit_types=None
+        ):
+    '''Returns an EdgeBuffer with the edges that make_network creates the
+    network from. Takes the same arguments as make_network.'''
+    # The basic logic is that we identify all the edits on a single
+    # page, then convert that page's edits to edges and move on to the
+    # next page
+    time_limit = np.timedelta64(datetime.timedelta(days = time_limit)) if time_limit else None
+    all_edges = EdgeBuffer()
+    for d in edits.page_frames():
+        namespaces = [x for x in d['namespace'].unique() if namespace_filter(x)]
+        all_edges.add(frame_edges(d[d['namespace'].isin(namespaces)],
+                edit_limit=edit_limit,
+                editor_limit=editor_limit,
+                time_limit=time_limit,
+                section_filter=section_filter,
+                engine=engine,
+                edit_types=edit_types))
+    count('edges', len(all_edges))
+    return all_edges
+
+
+def frame_edges(d,
+        edit_limit=None,
+        editor_limit=None,
+        time_limit=None,
+        section_filter=False,
+        engine='python',
+        edit_types=None
+        ):
+    '''Returns an EdgeBuffer with the edges from the edits in a dataframe sorted
+    by articleid and date_time (like the frames from Edits.page_frames). Unlike
+    make_edges, time_limit is a timedelta rather than a number of days.'''
 
-    def edges_from_page_edits(page_edits):
+    def edges_from_page_edits(page, edges):
         '''Go through each edit to a page and figure out which
-        subsequent edits should have edges to this edit'''
-        if len(page_edits) == 0:
-            return []
-        edges = []
-        # If it's a talk page, figure out the owner
-        page_owner = get_talk_page_owner(page_edits[0])
-        for i, edit in enumerate(page_edits):
-            # Reset temp variables
-            curr_edges = []
+        subsequent edits should have edges to this edit. The edges are
+        appended to edges, which has a list for each EdgeBuffer field.'''
+        if len(page.editor) == 0:
+            return
+        columns = [edges[field] for field in EdgeBuffer.FIELDS]
+        def add_edge(edge):
+            for column, value in zip(columns, edge):
+                column.append(value)
+        edit_types = edges['edit_type']
+        # Pull the columns out as lists, since indexing those is much
+        # faster than indexing the arrays
+        editors = page.editor.tolist()
+        anons = page.anon.tolist()
+        times = page.date_time
+        seconds = page.date_time.astype('datetime64[s]').astype(np.int64).tolist()
+        sections = page.section.tolist() if section_filter else None
+        # Find where each edit's time window ends. Edits after that are too late,
+        # so the inner loop never looks at them.
+        if time_limit:
+            window_ends = np.searchsorted(times, times + time_limit, side='right').tolist()
+        else:
+            window_ends = [len(editors)] * len(editors)
+        for i, editor in enumerate(editors):
+            # Reset temp variables; this edit's edges start at curr_start
+            curr_start = len(edit_types)
             curr_editors = []
-            curr_section = get_section_from_comment(edit) if section_filter else None
-            curr_time = edit['date_time']
+            curr_section = sections[i] if section_filter else None
+            curr_time = seconds[i]
             intermediate_edits = 1
 
-            # If this is a talk page, then add edges to the owner of the page
-            if page_owner and page_owner != edit['editor']:
-                edges.append(make_user_talk_edge(edit, page_owner))
-
-            # Now loop through all subsequent edits
-            for j in range(i+1, len(page_edits)):
-                new_edit = page_edits[j]
+            # Now loop through all subsequent edits that are within the time limit
+            for j in range(i+1, window_ends[i]):
+                new_editor = editors[j]
                 # If the sections don't match, then pretend like this edit doesn't exist
-                if section_filter and get_section_from_comment(new_edit) != curr_section:
+                if section_filter and sections[j] != curr_section:
                     continue
 
-                # If this edit is too late then break (since all future
-                # edits will also be too late)
-                new_time = new_edit['date_time']
+                new_time = seconds[j]
 
                 # If they are the same person, then mark the previous edits as
                 # collaborative, and break the inner loop
                 # (since future edges will be captured once we get to this
                 # edit in the main loop)
-                if same_editor(edit,new_edit):
-                    curr_edges = [e._replace(edit_type = 'collaborative') for e in curr_edges]
+                if new_editor == editor:
+                    edit_types[curr_start:] = [COLLABORATIVE] * (len(edit_types) - curr_start)
                     break
 
                 # Add this editor to the set of editors, if necessary
-                if new_edit['editor'] in curr_editors:
+                if new_editor in curr_editors:
                     # One edit can't result in multiple
                     # edges to the same alter. E.g., if A edits the page
                     # and then B, C, B edit the page A will only have 1 tie with B. 
@@ -385,16 +1437,17 @@ def make_network(edits,
                     intermediate_edits += 1
                     continue
                 else:
-                    curr_editors.append(new_edit['editor'])
+                    curr_editors.append(new_editor)
 
                 # Create a new edge, and add it
-                curr_edges.append(Edge(
-                    from_node = new_edit['editor'],
-                    to_node = edit['editor'],
-                    edit_type = 'normal',
-                    from_anon = new_edit['anon'],
-                    to_anon = edit['anon'],
+                add_edge(Edge(
+                    from_node = new_editor,
+                    to_node = editor,
+                    edit_type = NORMAL,
+                    from_anon = anons[j],
+                    to_anon = anons[i],
                     timediff = new_time - curr_time,
+                    from_time = new_time,
                     intermediate_edits = intermediate_edits,
                     intermediate_editors = len(curr_editors),
                     ))
@@ -409,90 +1462,608 @@ def make_network(edits,
                         (editor_limit and len(curr_editors) == editor_limit)
                         ):
                     break
-            # At the end of the loop, add the edges
-            edges += curr_edges
+
+
+    def add_edges(new_edges):
+        '''Moves edges from lists into all_edges, keeping only edit_types'''
+        edges = EdgeBuffer()
+        edges.extend(**new_edges)
+        all_edges.add(filter_edit_types(edges, edit_types))
+
+    all_edges = EdgeBuffer()
+    if engine == 'vectorized':
+        all_edges.add(filter_edit_types(vectorized_edges(d,
+                edit_limit=edit_limit,
+                editor_limit=editor_limit,
+                time_limit=time_limit,
+                section_filter=section_filter), edit_types))
+    elif engine == 'python':
+        # Edges to the owners of user talk pages don't depend on the other
+        # edits, so they're made for all of the pages at once
+        if edit_types is None or 'user_talk_owner' in edit_types:
+            all_edges.add(user_talk_edges(d))
+        # Edges are collected in lists, and moved into the buffer in chunks
+        new_edges = {field: [] for field in EdgeBuffer.FIELDS}
+        for page in frame_batches(d, sections=section_filter):
+            edges_from_page_edits(page, new_edges)
+            if len(new_edges['from_node']) >= EdgeBuffer.CHUNK_SIZE:
+                add_edges(new_edges)
+                new_edges = {field: [] for field in EdgeBuffer.FIELDS}
+        add_edges(new_edges)
+    else:
+        raise ValueError("Unknown engine: {}".format(engine))
+    return all_edges
+
+
+def filter_edit_types(edges, edit_types):
+    '''Returns the edges in an EdgeBuffer whose type is in edit_types (all of
+    them, if edit_types is None)'''
+    if edit_types is None:
+        return edges
+    return edges.take(np.isin(edges['edit_type'], [EDIT_TYPES.index(x) for x in edit_types]))
+
+
+class IncrementalNetwork:
+    '''Builds a network from edits that arrive over time, e.g., from periodic dumps
+    of the same wiki. Rather than keeping every edit, it keeps the state of the
+    "open" edits on each page: those whose editor hasn't returned yet and that
+    haven't hit edit_limit/editor_limit, since these are the only edits that
+    newer edits can still create edges to. Each update only looks at edits newer
+    than the last one processed, so its cost depends on the new edits rather
+    than on the wiki's whole history.
+
+    The network is the same as one made by make_network with the same parameters
+    from all of the edits (before dichotomizing). The edges that each update
+    returns are marked collaborative when the editor comes back within the same
+    update; edges from earlier updates have already been returned, so they stay
+    normal even if the editor comes back later.'''
+
+    def __init__(self,
+            edit_limit=None,
+            editor_limit=None,
+            time_limit=None, # In days, like make_network
+            section_filter=False):
+        self.edit_limit = edit_limit
+        self.editor_limit = editor_limit
+        # The open edits store times as int seconds, like EdgeBuffer
+        self.time_limit = int(datetime.timedelta(days = time_limit).total_seconds()) if time_limit else None
+        self.section_filter = section_filter
+        # articleid -> list of open edits, oldest first
+        self.pages = {}
+        self.network = EditNetwork()
+        self.last_time = None
+        # Counts the updates, so open edits know which of their edges are in this one
+        self.updates = 0
+
+    def update(self, edits, namespace_filter = lambda x: True):
+        '''Adds the edits in an Edits object that are newer than the last update
+        to the network. Returns the new edges, as an EdgeBuffer.'''
+        self.updates += 1
+        new_edges = {field: [] for field in EdgeBuffer.FIELDS}
+        latest = self.last_time
+        for page in edits.page_batches(sections=self.section_filter):
+            if not namespace_filter(page.namespace):
+                continue
+            if self.last_time is not None:
+                is_new = page.date_time > self.last_time
+                page = page._replace(editor = page.editor[is_new],
+                        anon = page.anon[is_new],
+                        date_time = page.date_time[is_new],
+                        comment = page.comment[is_new] if page.comment is not None else None,
+                        section = page.section[is_new] if page.section is not None else None)
+            if len(page.date_time) == 0:
+                continue
+            self.edges_from_new_page_edits(page, new_edges)
+            # The edits are in date order, so the last one is the latest
+            if latest is None or page.date_time[-1] > latest:
+                latest = page.date_time[-1]
+        self.last_time = latest
+        if self.time_limit and latest is not None:
+            # Edits from before the time limit can't get any more edges
+            latest_seconds = int(np.datetime64(latest, 's').astype(np.int64))
+            for articleid, open_edits in self.pages.items():
+                self.pages[articleid] = [x for x in open_edits
+                        if latest_seconds - x['date_time'] <= self.time_limit]
+        edges = EdgeBuffer()
+        edges.extend(**new_edges)
+        self.network.merge_edges(edges)
         return edges
 
-    def make_user_talk_edge(edit, page_owner):
-        return Edge(from_node = edit['editor'],
+    def edges_from_new_page_edits(self, page, edges):
+        '''Runs each new edit to a page against the page's open edits. This is the
+        loop in make_network turned inside out: rather than each edit looking
+        forward at the edits after it, each new edit is compared with every
+        earlier edit that is still open. The edges are appended to edges, which
+        has a list for each EdgeBuffer field.'''
+        columns = [edges[field] for field in EdgeBuffer.FIELDS]
+        edit_types = edges['edit_type']
+        def add_edge(edge):
+            for column, value in zip(columns, edge):
+                column.append(value)
+        def edges_in_update(edit):
+            '''Returns the list of indices of an open edit's edges in edges'''
+            if edit['update'] != self.updates:
+                edit['update'] = self.updates
+                edit['edges'] = []
+            return edit['edges']
+        open_edits = self.pages.get(page.articleid, [])
+        page_owner = get_talk_page_owner({'namespace': page.namespace, 'title': page.title})
+        # Section ids are only the same within a batch of pages, so the open
+        # edits keep the section names
+        if self.section_filter:
+            sections = [page.section_names[x] if x >= 0 else None for x in page.section.tolist()]
+        else:
+            sections = [None] * len(page.editor)
+        seconds = page.date_time.astype('datetime64[s]').astype(np.int64).tolist()
+        for editor, anon, new_time, section in zip(page.editor.tolist(), page.anon.tolist(),
+                seconds, sections):
+            # If this is a talk page, then add edges to the owner of the page
+            if page_owner and page_owner != editor:
+                add_edge(Edge(from_node = editor,
                     to_node = page_owner,
-                    from_anon = edit['anon'],
+                    from_time = new_time,
+                    from_anon = anon,
                     to_anon = is_anon(page_owner),
-                    edit_type = 'user_talk_owner'
-                    )
+                    edit_type = USER_TALK_OWNER,
+                    timediff = MISSING,
+                    intermediate_edits = MISSING,
+                    intermediate_editors = MISSING))
+            still_open = []
+            for edit in open_edits:
+                # This edit is too late, so it closes the open edit
+                if self.time_limit and new_time - edit['date_time'] > self.time_limit:
+                    continue
+                # If the sections don't match, then pretend like this edit doesn't exist
+                if self.section_filter and section != edit['section']:
+                    still_open.append(edit)
+                    continue
+                # The same person came back, so this edit is done, and its
+                # edges are collaborative
+                if editor == edit['editor']:
+                    for i in edges_in_update(edit):
+                        edit_types[i] = COLLABORATIVE
+                    continue
+                if editor in edit['editors']:
+                    edit['intermediate_edits'] += 1
+                    still_open.append(edit)
+                    continue
+                edit['editors'].append(editor)
+                edges_in_update(edit).append(len(edit_types))
+                add_edge(Edge(
+                    from_node = editor,
+                    to_node = edit['editor'],
+                    edit_type = NORMAL,
+                    from_anon = anon,
+                    to_anon = edit['anon'],
+                    timediff = new_time - edit['date_time'],
+                    from_time = new_time,
+                    intermediate_edits = edit['intermediate_edits'],
+                    intermediate_editors = len(edit['editors'])
+                    ))
+                edit['intermediate_edits'] += 1
+                if not (
+                        (self.edit_limit and edit['intermediate_edits'] > self.edit_limit) or
+                        (self.editor_limit and len(edit['editors']) == self.editor_limit)
+                        ):
+                    still_open.append(edit)
+            still_open.append({'editor': editor,
+                'anon': anon,
+                'date_time': new_time,
+                'section': section,
+                'editors': [],
+                'intermediate_edits': 1,
+                'update': self.updates,
+                'edges': []})
+            open_edits = still_open
+        self.pages[page.articleid] = open_edits
+
+    def get_network(self, dichotomize_level=1):
+        network = self.network.dichotomize(dichotomize_level)
+        if len(network.vs) == 0:
+            return None
+        return network
 
+    def save(self, fn):
+        with open(fn, 'wb') as f:
+            pickle.dump(self, f)
 
+    @staticmethod
+    def load(fn):
+        with open(fn, 'rb') as f:
+            return pickle.load(f)
 
-    '''The basic logic is that we identify all the edits on a single
-    page, then convert that page's edits to edges and move on to the
-    next page'''
-    time_limit = datetime.timedelta(days = time_limit) if time_limit else None
-    all_edges = []
-    curr_page = ''
-    curr_page_edits = []
 
-    edits = (x for x in edits.edits_iterator() if namespace_filter(x['namespace']))
-    for edit in edits:
-        if edit['articleid'] != curr_page:
-            all_edges += edges_from_page_edits(curr_page_edits)
-            curr_page_edits = [edit]
-            curr_page = edit['articleid']
+def vectorized_edges(df,
+        edit_limit=None,
+        editor_limit=None,
+        time_limit=None,
+        section_filter=False):
+    '''Array-based equivalent of the per-page loop in make_network. Takes a
+    dataframe of cleaned edits (like Edits.df) and returns the same edges, as an EdgeBuffer.
+    Unlike make_network, time_limit is a timedelta rather than a number of days.
+
+    Rather than looping over the subsequent edits of each edit in turn, this
+    walks forward one step at a time for all of the edits at once: at step d,
+    every edit i that is still "open" is compared with edit i + d on the same
+    page. An edit is closed when its editor returns (making its edges
+    collaborative), when the page ends, when the next edit is past time_limit,
+    or when edit_limit/editor_limit is met.
+    '''
+    if len(df) == 0:
+        return EdgeBuffer()
+    df = df.sort_values(['articleid','date_time'])
+    edges = user_talk_edges(df)
+
+    article = df['articleid'].to_numpy()
+    if section_filter:
+        section = section_ids(df['comment'] if 'comment' in df else [None] * len(df))[0]
+        # Edits to other sections are skipped, so each (page, section) pair is
+        # treated as its own page. lexsort is stable, so date order is kept.
+        order = np.lexsort((section, article))
+        article, section = article[order], section[order]
+    else:
+        order = np.arange(len(df))
+        section = np.zeros(len(df), dtype=np.int64)
+    editor_names = df['editor'].to_numpy()[order]
+    editor = pd.factorize(editor_names)[0]
+    anon = df['anon'].to_numpy()[order]
+    date_time = df['date_time'].to_numpy()[order]
+
+    n = len(order)
+    positions = np.arange(n)
+    # Mark where each group of edits starts, and find where it ends
+    group_start = np.ones(n, dtype=bool)
+    group_start[1:] = (article[1:] != article[:-1]) | (section[1:] != section[:-1])
+    group = np.cumsum(group_start) - 1
+    group_end = np.append(positions[group_start][1:], n)[group]
+    # For each edit, find the previous edit in the group by the same editor
+    key = group * (editor.max() + 1) + editor
+    by_key = np.lexsort((positions, key))
+    prev_same = np.full(n, -1)
+    repeat = key[by_key[1:]] == key[by_key[:-1]]
+    prev_same[by_key[1:][repeat]] = by_key[:-1][repeat]
+
+    intermediate_edits = np.ones(n, dtype=np.int64)
+    intermediate_editors = np.zeros(n, dtype=np.int64)
+    collaborative = np.zeros(n, dtype=bool)
+    to_idx, from_idx, edit_counts, editor_counts = [], [], [], []
+    active = positions
+    step = 1
+    while len(active):
+        new_idx = active + step
+        in_group = new_idx < group_end[active]
+        if time_limit:
+            in_group[in_group] = date_time[new_idx[in_group]] - date_time[active[in_group]] <= time_limit
+        active, new_idx = active[in_group], new_idx[in_group]
+        # If the same editor returns, then the edges are collaborative
+        same = editor[new_idx] == editor[active]
+        collaborative[active[same]] = True
+        active, new_idx = active[~same], new_idx[~same]
+        # Editors who already edited since edit i don't get another edge
+        is_new = prev_same[new_idx] < active
+        to_new, from_new = active[is_new], new_idx[is_new]
+        intermediate_editors[to_new] += 1
+        to_idx.append(to_new)
+        from_idx.append(from_new)
+        edit_counts.append(intermediate_edits[to_new])
+        editor_counts.append(intermediate_editors[to_new])
+        intermediate_edits[active] += 1
+        # Same break conditions as the loop in make_network
+        done = np.zeros(len(active), dtype=bool)
+        if edit_limit:
+            done[is_new] |= intermediate_edits[to_new] > edit_limit
+        if editor_limit:
+            done[is_new] |= intermediate_editors[to_new] == editor_limit
+        active = active[~done]
+        step += 1
+
+    to_idx = np.concatenate(to_idx)
+    from_idx = np.concatenate(from_idx)
+    seconds = date_time.astype('datetime64[s]').astype(np.int64)
+    edges.extend(from_node = editor_names[from_idx],
+            to_node = editor_names[to_idx],
+            from_anon = anon[from_idx],
+            to_anon = anon[to_idx],
+            edit_type = np.where(collaborative[to_idx], COLLABORATIVE, NORMAL),
+            timediff = seconds[from_idx] - seconds[to_idx],
+            intermediate_edits = np.concatenate(edit_counts),
+            intermediate_editors = np.concatenate(editor_counts),
+            from_time = seconds[from_idx])
+    return edges
+
+
+def user_talk_edges(df):
+    '''Returns edges from each editor of a user talk page to the owner of the
+    page, as an EdgeBuffer. Takes a dataframe of edits. The owner is parsed
+    once for each user talk page title.'''
+    d = df[df['namespace'].to_numpy() == 3]
+    title_ids, titles = pd.factorize(d['title'].to_numpy(dtype=object))
+    owners = talk_page_owners(titles)
+    owner = owners[title_ids]
+    to_owner = pd.notna(owner) & (owner != d['editor'].to_numpy(dtype=object))
+    d, owner = d[to_owner], owner[to_owner]
+    edges = EdgeBuffer()
+    edges.extend(from_node = d['editor'].to_numpy(),
+            to_node = owner,
+            from_anon = d['anon'].to_numpy(),
+            to_anon = find_anons(pd.Series(owner, dtype=object)).to_numpy(dtype=bool),
+            edit_type = np.full(len(d), USER_TALK_OWNER),
+            from_time = d['date_time'].to_numpy().astype('datetime64[s]').astype(np.int64))
+    return edges
+
+
+def frame_batches(d, sections=False):
+    '''Yields a PageBatch for each page in a dataframe sorted by articleid and date_time'''
+    if len(d) == 0:
+        return
+    articleid = d['articleid'].to_numpy()
+    namespace = d['namespace'].to_numpy()
+    title = d['title'].to_numpy()
+    editor = d['editor'].to_numpy()
+    anon = d['anon'].to_numpy()
+    date_time = d['date_time'].to_numpy()
+    comment = d['comment'].to_numpy() if 'comment' in d else None
+    if sections:
+        section, section_names = section_ids(comment if comment is not None else [None] * len(d))
+    else:
+        section = section_names = None
+    # Find the rows where each page starts and ends
+    starts = np.flatnonzero(np.r_[True, articleid[1:] != articleid[:-1]])
+    ends = np.r_[starts[1:], len(articleid)]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        yield PageBatch(articleid = articleid[start],
+                namespace = namespace[start],
+                title = title[start],
+                editor = editor[start:end],
+                anon = anon[start:end],
+                date_time = date_time[start:end],
+                comment = comment[start:end] if comment is not None else None,
+                section = section[start:end] if section is not None else None,
+                section_names = section_names)
+
+
+def merge_runs(runs):
+    '''Merges sorted runs of edits written by Edits.write_run. Each run is a list of
+    pickled blocks, sorted by articleid and date_time. Yields dataframes of complete
+    pages, sorted the same way, while only holding about one block per run in memory.'''
+    blocks = [iter(run) for run in runs]
+    buffers = [pd.DataFrame() for run in runs]
+    exhausted = [False] * len(runs)
+
+    def refill(i):
+        fn = next(blocks[i], None)
+        if fn is None:
+            exhausted[i] = True
         else:
-            curr_page_edits.append(edit)
-    # Get the last pages edges
-    all_edges += edges_from_page_edits(curr_page_edits)
-    # Make the network
-    network = EditNetwork()
-    network.make_network(all_edges)
-    network = network.dichotomize(dichotomize_level)
-    if len(network.vs) == 0:
-        return None
-    return network
+            buffers[i] = pd.concat([buffers[i], pd.read_pickle(fn)])
+
+    while True:
+        for i in range(len(runs)):
+            if not exhausted[i] and len(buffers[i]) == 0:
+                refill(i)
+        open_runs = [i for i in range(len(runs)) if not exhausted[i]]
+        if not open_runs:
+            rest = [b for b in buffers if len(b)]
+            if rest:
+                yield pd.concat(rest).sort_values(['articleid','date_time'], kind='mergesort')
+            return
+        # Every run is sorted, so pages before the lowest page that an open run
+        # has reached are complete
+        bound = min(buffers[i]['articleid'].iloc[-1] for i in open_runs)
+        ready = [b[b['articleid'] < bound] for b in buffers]
+        buffers = [b[b['articleid'] >= bound] for b in buffers]
+        ready = [b for b in ready if len(b)]
+        if ready:
+            yield pd.concat(ready).sort_values(['articleid','date_time'], kind='mergesort')
+        # Read more of the runs that are stuck on the bound page
+        for i in open_runs:
+            if buffers[i]['articleid'].iloc[-1] == bound:
+                refill(i)
+
+
+# The columns of Edits.df that networks are made from
+NETWORK_COLUMNS = ['articleid', 'title', 'namespace', 'editor', 'anon', 'date_time', 'comment']
+
+# Types of the edge attributes that EditNetwork makes, for writing and reading
+# them (see EditNetwork.write_edges). ints can be missing, so they're stored as floats.
+EDGE_ATTRIBUTE_TYPES = {'weight': float,
+        'user_talk_weight': float,
+        'from_anon': bool,
+        'to_anon': bool,
+        'from_time': 'datetime64[s]',
+        'non_user_talk_from_time': 'datetime64[s]',
+        'timediff': 'timedelta64[s]',
+        'intermediate_edits': int,
+        'intermediate_editors': int}
+
+
+def attribute_array(values, dtype=None):
+    '''Turns a list of attribute values into an array of the given type (from
+    EDGE_ATTRIBUTE_TYPES), with None as NaN or NaT. Other attributes are
+    stored as strings if NumPy can't find a better type for them.'''
+    if dtype is int:
+        return np.array([np.nan if x is None else x for x in values], dtype=float)
+    if dtype is not None:
+        return np.array(values, dtype=dtype)
+    values = np.array(values)
+    return values.astype(str) if values.dtype == object else values
+
+
+def tsv_column(values):
+    '''Formats an array from EditNetwork.edge_columns for a tsv file. Times
+    between edits are in seconds, and missing values are left blank.'''
+    if values.dtype.kind == 'm':
+        values = values / np.timedelta64(1, 's')
+    if values.dtype.kind == 'f' and np.array_equal(values[~np.isnan(values)], np.round(values[~np.isnan(values)])):
+        return pd.array(values, dtype='Int64')
+    return values
+
+
+def from_tsv_column(values, dtype=None):
+    '''Reverses tsv_column, for a Series of strings read from a tsv file'''
+    if dtype is None:
+        try:
+            return pd.to_numeric(values.where(values != '')).to_numpy()
+        except ValueError:
+            return values.to_numpy(dtype=object)
+    if dtype is bool:
+        return (values == 'True').to_numpy()
+    if dtype == 'datetime64[s]':
+        return pd.to_datetime(values.where(values != '')).to_numpy().astype(dtype)
+    values = pd.to_numeric(values.where(values != '')).to_numpy(dtype=float)
+    if dtype == 'timedelta64[s]':
+        return pd.to_timedelta(values, unit='s').to_numpy().astype(dtype)
+    return values
+
+
+def min_with_none(x):
+    '''Returns the smallest value in x that isn't None, or None if there aren't any'''
+    filtered_list = [y for y in x if y is not None]
+    return min(filtered_list) if filtered_list else None
+
+
+def missing_to_none(values):
+    '''Turns an array into a list, replacing NaN and NaT with None. Whole
+    numbers stored as floats become ints.'''
+    if values.dtype.kind == 'f':
+        return [None if np.isnan(x) else int(x) for x in values.tolist()]
+    if values.dtype.kind in 'mM':
+        return [None if np.isnat(x) else x for x in values]
+    return values.tolist()
+
+
+def edit_mask(d, filter_func):
+    '''Returns a boolean array of which edits in d pass filter_func (see
+    Edits.threshold_filter)'''
+    if filter_func is None:
+        return np.ones(len(d), dtype=bool)
+    if isinstance(filter_func, str):
+        return d.eval(filter_func).to_numpy(dtype=bool)
+    try:
+        mask = filter_func(d)
+    except (TypeError, ValueError, AttributeError, KeyError):
+        mask = None
+    if np.ndim(mask) != 1 or len(mask) != len(d):
+        # It only works on single edits
+        mask = d.apply(filter_func, axis=1)
+    return np.asarray(mask, dtype=bool)
+
+
+def quality_scores(d):
+    '''Returns a quality score for each edit in d: 1 if the edit lasted, and 0
+    if it was reverted'''
+    return (~d['was_reverted'].to_numpy(dtype=bool)).astype(np.int8)
+
+
+def config_version():
+    '''Returns a hash of the lists in config that are used to clean edits'''
+    h = hashlib.blake2b(digest_size=8)
+    h.update(repr((sorted(config.editor_ignore_list),
+        config.bot_query.pattern,
+        sorted(config.bad_sha_list))).encode())
+    return h.hexdigest()
+
+
+def reverted_ids(reverteds):
+    '''Takes the reverteds column, and returns the revision ids that were reverted'''
+    # Some of them are actually a list of ids, so we need to split them.
+    return reverteds.dropna().str.split(',').explode().astype('int64').unique()
 
 
 def make_timestamp(edit):
     return datetime.datetime.strptime(edit['date_time'], '%Y-%m-%d %H:%M:%S')
 
 
+# Matches IPv4 and IPv6 addresses
+ANON_PATTERN = r'(?:[0-9]{1,3}\.){3}[0-9]{1,3}|[0-9A-Fa-f]{0,4}(?::[0-9A-Fa-f]{0,4}){2,7}'
+anon_query = re.compile(ANON_PATTERN)
+
 def is_anon(username):
-    '''Check if a username is an ipv4 ip address. We use this as
+    '''Check if a username is an ip address. We use this as
     a marker of whether the user is anonymous'''
-    if re.match('([0-9]{1,3}\.){3}[0-9]{1,3}',username):
+    if anon_query.fullmatch(username):
         return True
     else:
         return False
 
 
+def find_anons(editors):
+    '''Vectorized version of is_anon. Takes a Series of user names'''
+    return editors.str.fullmatch(ANON_PATTERN, na=False)
+
+
+def find_bots(editors):
+    '''Vectorized version of Edits.is_bot. Takes a Series of user names'''
+    return (editors.isin(config.editor_ignore_list) |
+            editors.str.match(config.bot_query.pattern, flags=config.bot_query.flags, na=False))
+
+
+def per_editor(editors, func):
+    '''Applies func to each unique editor name just once, and maps
+    the results back onto every edit'''
+    codes, names = pd.factorize(editors, use_na_sentinel=False)
+    results = func(pd.Series(names)).to_numpy()
+    return pd.Series(results[codes], index=editors.index)
+
+
 def same_editor(edit1, edit2):
     return edit1['editor'] == edit2['editor']
 
+# The user name in the title of a user talk page
+USER_TALK_PATTERN = re.compile('^[^:]+:(.*)$')
+
+
 def get_talk_page_owner(edit):
     '''Checks a talk page to see if it's a user talk page (ASSUMES THAT
     THESE ARE NAMESPACE 3). If it is a user talk
     page, then returns the user name. Otherwise, returns None'''
     if edit['namespace'] == 3:
-        return re.match('[^:]+:(.*)$',edit['title']).group(1)
+        return USER_TALK_PATTERN.match(edit['title']).group(1)
     else:
         return None
 
 
+def talk_page_owners(titles):
+    '''Vectorized get_talk_page_owner for user talk page titles. Returns an array
+    with the owner of each page, or None if the title doesn't name one.'''
+    owners = pd.Series(titles, dtype=object).str.extract(USER_TALK_PATTERN, expand=False)
+    return owners.where(owners != '', None).to_numpy(dtype=object)
+
+
+# Comments on edits to an existing section, and on the first edit to a section
+SECTION_EDIT_PATTERN = re.compile(r'^\/\* (.*) \*\/.*')
+NEW_SECTION_PATTERN = re.compile(r'^(.*)\[[^]]*\]$')
+
+
 def get_section_from_comment(edit):
     '''Finds the section an edit was made to, based on the comment.
 
     ASSUMPTION:
     The first edit to a section is formatted as "Section name [dd mon yyyy]".
-    Subsequent edits are "/* Section name \* Comment here".
+    Subsequent edits are "/* Section name */ Comment here".
     If there is no section name, then return None.'''
     try:
         comment = edit['comment']
     except KeyError:
         return None
-    if comment:
-        a = re.match(r'\/\* (.*) \*\/.*', comment)
+    if isinstance(comment, str):
+        a = SECTION_EDIT_PATTERN.match(comment)
         if a:
             return a.group(1).rstrip()
-        b = re.match(r'(.*)\[[^]]*\]$', comment)
+        b = NEW_SECTION_PATTERN.match(comment)
         if b:
             return b.group(1).rstrip()
     return None
 
+
+def section_ids(comments):
+    '''Vectorized get_section_from_comment. Takes the comments of a set of edits,
+    and returns (ids, names): an array with the id of each edit's section, or -1
+    if there isn't one, and an array with the name of each section.'''
+    comments = pd.Series(comments, dtype=object)
+    sections = comments.str.extract(SECTION_EDIT_PATTERN, expand=False)
+    new_sections = comments.str.extract(NEW_SECTION_PATTERN, expand=False)
+    sections = sections.fillna(new_sections).str.rstrip()
+    ids, names = pd.factorize(sections)
+    return ids, names.to_numpy(dtype=object)
+